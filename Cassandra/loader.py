@@ -1,7 +1,13 @@
 # loader.py
-from cassandra.query import BatchStatement
+from cassandra.concurrent import execute_concurrent
+from cassandra.query import BatchStatement, BatchType
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import csv
+import heapq
+import itertools
+import os
+import time
 
 from .model import (
     CREATE_KEYSPACE,
@@ -16,7 +22,17 @@ from .model import (
     CREATE_RECEIVED_TRANSACTIONS_BY_USER_TABLE,
     CREATE_DUPLICATE_TRANSACTIONS_BY_USER_TABLE,
     CREATE_TRANSACTION_STATUS_CHANGES_TABLE,
+    CREATE_TOP_ACCOUNTS_BY_BUCKET_TABLE,
+    CREATE_TOP_OUT_OF_RANGE_BY_BUCKET_TABLE,
+    CREATE_STATUS_CHANGES_BY_USER_TABLE,
+    CREATE_USER_TX_MONTHS_TABLE,
+    CREATE_TRANSACTIONS_BY_USER_MONTH_TABLE,
+    CREATE_RECEIVED_TRANSACTIONS_BY_USER_MONTH_TABLE,
+    LEADERBOARD_TOP_N,
+    leaderboard_bucket,
+    month_bucket,
 )
+from .utils import print_table
 
 
 # Helpers de tipos
@@ -83,11 +99,169 @@ def create_keyspace_and_tables(session, keyspace_name: str, replication_factor:
     session.execute(CREATE_RECEIVED_TRANSACTIONS_BY_USER_TABLE)
     session.execute(CREATE_DUPLICATE_TRANSACTIONS_BY_USER_TABLE)
     session.execute(CREATE_TRANSACTION_STATUS_CHANGES_TABLE)
+    session.execute(CREATE_TOP_ACCOUNTS_BY_BUCKET_TABLE)
+    session.execute(CREATE_TOP_OUT_OF_RANGE_BY_BUCKET_TABLE)
+    session.execute(CREATE_STATUS_CHANGES_BY_USER_TABLE)
+
+    # Esquema opcional con particiones (user_id, month)
+    session.execute(CREATE_USER_TX_MONTHS_TABLE)
+    session.execute(CREATE_TRANSACTIONS_BY_USER_MONTH_TABLE)
+    session.execute(CREATE_RECEIVED_TRANSACTIONS_BY_USER_MONTH_TABLE)
 
 
 # ---------------------------------------------------------
 # Carga genérica desde CSV
 # ---------------------------------------------------------
+
+# Parámetros por defecto del bulk loader
+DEFAULT_CONCURRENCY = 64      # peticiones en vuelo por tabla
+DEFAULT_BATCH_SIZE = 20       # filas máximas por batch UNLOGGED de una misma partición
+DEFAULT_CHUNK_SIZE = 5000     # filas leídas antes de despachar (acota memoria)
+
+
+def convert_row(row: dict, columns: list, converters: dict):
+    """
+    Convierte una fila del CSV a la lista de valores en el orden de 'columns'.
+    """
+    values = []
+    for col in columns:
+        raw_val = row[col]
+
+        if raw_val == "" or raw_val is None:
+            values.append(None)
+            continue
+
+        if col in converters:
+            values.append(converters[col](raw_val))
+        else:
+            values.append(default_convert(raw_val))
+    return values
+
+
+class _PartitionWriter:
+    """
+    Acumula filas de UNA tabla y las convierte en sentencias preparadas.
+    Con 'partition_key' (columna o tupla de columnas si la partición es
+    compuesta) las filas de la misma partición se agrupan en batches UNLOGGED
+    de hasta 'batch_size' filas.
+    """
+
+    def __init__(self, session, keyspace_name, table_name, columns, partition_key=None, batch_size=DEFAULT_BATCH_SIZE):
+        placeholders = ", ".join(["?"] * len(columns))
+        cols_str = ", ".join(columns)
+        # Nombre calificado: la Session puede compartirse entre hilos sin depender de USE
+        insert_cql = f"INSERT INTO {keyspace_name}.{table_name} ({cols_str}) VALUES ({placeholders})"
+
+        self.table_name = table_name
+        self.prepared = session.prepare(insert_cql)
+        if not partition_key:
+            self.pk_idx = None
+        elif isinstance(partition_key, str):
+            self.pk_idx = [columns.index(partition_key)]
+        else:
+            self.pk_idx = [columns.index(col) for col in partition_key]
+        self.batch_size = batch_size
+        self.ready = []    # grupos de filas listos para enviar
+        self.groups = {}   # {partition_key: [valores, ...]} aún abiertos
+        self.rows = 0
+
+    def add(self, values):
+        self.rows += 1
+        if self.pk_idx is None:
+            self.ready.append([values])
+            return
+
+        key = tuple(values[i] for i in self.pk_idx)
+        rows = self.groups.setdefault(key, [])
+        rows.append(values)
+        if len(rows) >= self.batch_size:
+            # Partición llena: queda lista como batch propio
+            self.ready.append(self.groups.pop(key))
+
+    def drain(self):
+        """
+        Devuelve las sentencias pendientes (incluidos los grupos abiertos) y vacía el buffer.
+        """
+        self.ready.extend(self.groups.values())
+        self.groups.clear()
+
+        statements = []
+        for rows in self.ready:
+            if len(rows) == 1:
+                statements.append((self.prepared, rows[0]))
+                continue
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for values in rows:
+                batch.add(self.prepared, values)
+            statements.append((batch, None))
+
+        self.ready = []
+        return statements
+
+
+class _LeaderboardWriter:
+    """
+    Writer para una tabla leaderboard: mismas columnas que la tabla base más
+    'bucket' al inicio. Mantiene un heap de tamaño 'top_n' por bucket con las
+    filas de mayor 'sort_column' y solo las escribe en finish(), así cada
+    partición guarda a lo más 'top_n' filas.
+    """
+
+    def __init__(self, session, keyspace_name, leaderboard, columns, partition_key, sort_column,
+                 batch_size, top_n=LEADERBOARD_TOP_N):
+        self.writer = _PartitionWriter(session, keyspace_name, leaderboard, ["bucket"] + columns, "bucket", batch_size)
+        self.key_idx = columns.index(partition_key)
+        self.sort_idx = columns.index(sort_column)
+        self.top_n = top_n
+        self.heaps = {}     # {bucket: [(valor de orden, seq, valores), ...]}
+        self.seq = itertools.count()
+
+    def add(self, values):
+        sort_value = values[self.sort_idx]
+        if sort_value is None:
+            return
+        heap = self.heaps.setdefault(leaderboard_bucket(values[self.key_idx]), [])
+        item = (sort_value, next(self.seq), values)
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, item)
+        elif sort_value > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def finish(self):
+        """Pasa el top de cada bucket al writer; se llama una vez al terminar la lectura"""
+        for bucket, heap in self.heaps.items():
+            for _, _, values in heap:
+                self.writer.add([bucket] + values)
+        self.heaps = {}
+
+    def drain(self):
+        return self.writer.drain()
+
+    @property
+    def rows(self):
+        return self.writer.rows
+
+
+def _execute_statements(session, statements, concurrency):
+    """
+    Envía las sentencias con execute_concurrent (máximo 'concurrency' en vuelo).
+    """
+    if statements:
+        execute_concurrent(session, statements, concurrency=concurrency, raise_on_first_error=True)
+
+
+def _load_stats(table_name, rows, size_bytes, elapsed):
+    rows_per_s = rows / elapsed if elapsed > 0 else 0.0
+    print(f"   ✅ {table_name}: {rows} filas en {elapsed:.2f}s ({rows_per_s:,.0f} filas/s)")
+    return {
+        "table": table_name,
+        "rows": rows,
+        "bytes": size_bytes,
+        "elapsed": elapsed,
+        "rows_per_s": rows_per_s,
+    }
+
+
 def load_csv_into_table(
     session,
     keyspace_name: str,
@@ -95,10 +269,20 @@ def load_csv_into_table(
     csv_path: str,
     columns: list,
     converters: dict | None = None,
-    batch_size: int = 50,
+    partition_key: str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    leaderboard: str | None = None,
+    mirrors: list | None = None,
 ):
     """
-    Carga un CSV en una tabla Cassandra usando BatchStatement.
+    Carga un CSV en una tabla Cassandra con inserts preparados concurrentes.
+
+    Las filas se envían con execute_concurrent manteniendo como máximo
+    'concurrency' peticiones en vuelo. Si se indica 'partition_key', las filas
+    que comparten partición se agrupan en batches UNLOGGED (nunca se mezclan
+    particiones en un mismo batch).
 
     :param session: sesión de Cassandra
     :param keyspace_name: nombre del keyspace
@@ -106,225 +290,474 @@ def load_csv_into_table(
     :param csv_path: ruta al archivo CSV
     :param columns: lista de columnas en el mismo orden que el CSV
     :param converters: dict opcional {col_name: func_conversion}
-    :param batch_size: tamaño del batch para inserts
+    :param partition_key: columna de partición para agrupar filas (opcional)
+    :param concurrency: número máximo de peticiones en vuelo
+    :param batch_size: filas máximas por batch de una misma partición
+    :param chunk_size: filas acumuladas antes de despachar
+    :param leaderboard: (tabla leaderboard, columna de orden) a mantener junto con la tabla (ver LEADERBOARDS)
+    :param mirrors: lista de (tabla, partition_key) con las mismas columnas que se
+                    escriben con cada fila (ver MIRRORS)
+    :return: dict con estadísticas {table, rows, bytes, elapsed, rows_per_s}
     """
-    session.set_keyspace(keyspace_name)
-
-    placeholders = ", ".join(["?"] * len(columns))
-    cols_str = ", ".join(columns)
-    insert_cql = f"INSERT INTO {table_name} ({cols_str}) VALUES ({placeholders})"
-    prepared = session.prepare(insert_cql)
-
     if converters is None:
         converters = {}
 
+    writer = _PartitionWriter(session, keyspace_name, table_name, columns, partition_key, batch_size)
+    writers = [writer]
+    lb_writer = None
+    if leaderboard:
+        lb_table, sort_column = leaderboard
+        lb_writer = _LeaderboardWriter(
+            session, keyspace_name, lb_table, columns, partition_key, sort_column, batch_size
+        )
+        writers.append(lb_writer)
+    mirror_writers = [
+        _PartitionWriter(session, keyspace_name, mirror_table, columns, mirror_key, batch_size)
+        for mirror_table, mirror_key in mirrors or []
+    ]
+    writers.extend(mirror_writers)
+
+    def drain_all():
+        return [stmt for w in writers for stmt in w.drain()]
+
+    start = time.perf_counter()
+    buffered = 0
+
     with open(csv_path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        batch = BatchStatement()
-        count = 0
 
         for row in reader:
-            values = []
-            for col in columns:
-                raw_val = row[col]
-
-                if raw_val == "" or raw_val is None:
-                    values.append(None)
-                    continue
+            values = convert_row(row, columns, converters)
+            writer.add(values)
+            if lb_writer:
+                lb_writer.add(values)
+            for mirror in mirror_writers:
+                mirror.add(values)
+            buffered += 1
 
-                if col in converters:
-                    values.append(converters[col](raw_val))
-                else:
-                    values.append(default_convert(raw_val))
+            if buffered >= chunk_size:
+                _execute_statements(session, drain_all(), concurrency)
+                buffered = 0
 
-            batch.add(prepared, values)
-            count += 1
+        # Ejecutar lo que quede (incluido el top por bucket del leaderboard)
+        if lb_writer:
+            lb_writer.finish()
+        _execute_statements(session, drain_all(), concurrency)
 
-            if count % batch_size == 0:
-                session.execute(batch)
-                batch.clear()
-
-        # Ejecutar lo que quede
-        if len(batch) > 0:
-            session.execute(batch)
+    return _load_stats(table_name, writer.rows, os.path.getsize(csv_path), time.perf_counter() - start)
 
 
 # ---------------------------------------------------------
-# Carga info de todas las tablas desde CSV
+# Definición de las tablas a cargar desde CSV
 # ---------------------------------------------------------
-def load_all_data(session, keyspace_name: str, base_path: str = "data"):
-    """
-    Carga los datos de TODOS los CSV en sus tablas correspondientes.
-    Se asume que los archivos CSV existen en la carpeta 'base_path'.
-    """
 
+# Columnas comunes de las tablas de transacciones (origen → destino)
+TX_COLUMNS = ["user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"]
+TX_CONVERTERS = {
+    "user_id": int,
+    "tx_id": int,
+    "amount": float,
+    # account_dty es TEXT → sin conversor
+    "user_dty": int,
+    "tx_date": parse_date,
+}
+
+# Columnas comunes de las tablas de transacciones recibidas
+RECEIVED_COLUMNS = ["user_id", "date", "tx_id", "account_id", "sender_acc_id", "amount", "status", "tx_type"]
+RECEIVED_CONVERTERS = {
+    "user_id": int,
+    "tx_id": int,
+    "amount": float,
+    "date": parse_date,
+}
+
+# Tablas leaderboard que se mantienen al cargar su tabla base
+# {tabla base: (leaderboard, columna por la que se ordena el top)}
+LEADERBOARDS = {
+    "accounts_by_transactions": ("top_accounts_by_bucket", "total_transacciones"),
+    "out_of_range_transactions": ("top_out_of_range_by_bucket", "amount"),
+}
+
+# Tablas de consulta con las mismas columnas que su tabla base pero otra partición
+# {tabla base: [(tabla espejo, partition_key), ...]}
+MIRRORS = {
+    "transaction_status_changes": [("status_changes_by_user", "user_id")],
+}
+
+# Cada entrada: tabla destino (y nombre del CSV), columnas, conversores y clave de partición
+TABLE_SPECS = [
     # 1) transactions_by_user.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "transactions_by_user",
-        f"{base_path}/transactions_by_user.csv",
-        ["user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            # account_dty es TEXT → sin conversor
-            "user_dty": int,
-            "tx_date": parse_date,
-        },
-    )
-
+    {"table": "transactions_by_user", "columns": TX_COLUMNS, "converters": TX_CONVERTERS, "partition_key": "user_id"},
     # 2) top_transactions_by_user.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "top_transactions_by_user",
-        f"{base_path}/top_transactions_by_user.csv",
-        ["user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "user_dty": int,
-            "tx_date": parse_date,
-        },
-    )
-
+    {"table": "top_transactions_by_user", "columns": TX_COLUMNS, "converters": TX_CONVERTERS, "partition_key": "user_id"},
     # 3) transfers_by_user.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "transfers_by_user",
-        f"{base_path}/transfers_by_user.csv",
-        ["user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "user_dty": int,
-            "tx_date": parse_date,
-        },
-    )
-
+    {"table": "transfers_by_user", "columns": TX_COLUMNS, "converters": TX_CONVERTERS, "partition_key": "user_id"},
     # 4) out_of_range_transactions.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "out_of_range_transactions",
-        f"{base_path}/out_of_range_transactions.csv",
-        ["user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "user_dty": int,
-            "tx_date": parse_date,
-        },
-    )
-
+    {"table": "out_of_range_transactions", "columns": TX_COLUMNS, "converters": TX_CONVERTERS, "partition_key": "user_id"},
     # 5) rejected_attempts_by_user.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "rejected_attempts_by_user",
-        f"{base_path}/rejected_attempts_by_user.csv",
-        ["user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "user_dty": int,
-            "tx_date": parse_date,
-        },
-    )
-
+    {"table": "rejected_attempts_by_user", "columns": TX_COLUMNS, "converters": TX_CONVERTERS, "partition_key": "user_id"},
     # 6) accounts_by_transactions.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "accounts_by_transactions",
-        f"{base_path}/accounts_by_transactions.csv",
-        ["user_id", "account_id", "total_transacciones", "account_balance"],
-        converters={
+    {
+        "table": "accounts_by_transactions",
+        "columns": ["user_id", "account_id", "total_transacciones", "account_balance"],
+        "converters": {
             "user_id": int,
             "total_transacciones": int,
             "account_balance": float,
         },
-    )
-
+        "partition_key": "user_id",
+    },
     # 7) realtime_transactions.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "realtime_transactions",
-        f"{base_path}/realtime_transactions.csv",
-        ["tx_day", "user_id", "account_id", "tx_id", "amount", "type_tx", "state", "account_dty", "user_dty", "tx_date"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "user_dty": int,
-            "tx_date": parse_date,
-        },
-    )
-
+    {
+        "table": "realtime_transactions",
+        "columns": ["tx_day"] + TX_COLUMNS,
+        "converters": TX_CONVERTERS,
+        "partition_key": "tx_day",
+    },
     # 8) alerts_by_account_status.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "alerts_by_account_status",
-        f"{base_path}/alerts_by_account_status.csv",
-        ["account_id", "status", "alert_id", "date_detected", "user_id", "trs_id", "alert_type", "riskscore", "descrip"],
-        converters={
+    {
+        "table": "alerts_by_account_status",
+        "columns": ["account_id", "status", "alert_id", "date_detected", "user_id", "trs_id", "alert_type", "riskscore", "descrip"],
+        "converters": {
             "alert_id": int,
             "date_detected": parse_timestamp,
             "user_id": int,
             "trs_id": int,
             "riskscore": int,
         },
-    )
-
+        "partition_key": "account_id",
+    },
     # 9) received_transactions_by_user.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "received_transactions_by_user",
-        f"{base_path}/received_transactions_by_user.csv",
-        ["user_id", "date", "tx_id", "account_id", "sender_acc_id", "amount", "status", "tx_type"],
-        converters={
+    {"table": "received_transactions_by_user", "columns": RECEIVED_COLUMNS, "converters": RECEIVED_CONVERTERS, "partition_key": "user_id"},
+    # 10) duplicate_transactions_by_user.csv
+    {"table": "duplicate_transactions_by_user", "columns": RECEIVED_COLUMNS, "converters": RECEIVED_CONVERTERS, "partition_key": "user_id"},
+    # 11) transaction_status_changes.csv
+    {
+        "table": "transaction_status_changes",
+        "columns": ["trs_id", "account_id", "user_id", "old_status", "new_status", "change_date", "change_reason"],
+        "converters": {
+            "trs_id": int,
             "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "date": parse_date,
+            "change_date": parse_timestamp,
         },
-    )
+        "partition_key": "trs_id",
+    },
+]
 
-    # 10) duplicate_transactions_by_user.csv
-    load_csv_into_table(
+
+# ---------------------------------------------------------
+# Fan-out: tablas de transacciones desde un único CSV canónico
+# ---------------------------------------------------------
+
+# Archivo canónico con TODAS las transacciones (mismas columnas que TX_COLUMNS)
+CANONICAL_TX_FILE = "transactions.csv"
+
+# Reglas de ruteo del fan-out. Son una aproximación: los CSV curados de
+# data/Cassandra no salen de una regla (p. ej. top_transactions_by_user trae
+# 1 o 2 filas según el usuario), así que el fan-out es opt-in
+# (CASSANDRA_TX_FANOUT / fanout_path) y por defecto se cargan los CSV tal cual.
+
+OUT_OF_RANGE_THRESHOLD = 3000.0            # monto a partir del cual una tx está fuera de rango
+REJECTED_STATES = {"rejected", "failed"}   # estados que cuentan como intento rechazado
+TOP_K_PER_USER = 5                         # operaciones de mayor monto por usuario
+
+# Tablas que se derivan del archivo canónico
+FANOUT_TABLES = [
+    "transactions_by_user",
+    "top_transactions_by_user",
+    "transfers_by_user",
+    "out_of_range_transactions",
+    "rejected_attempts_by_user",
+]
+
+
+def build_fanout_routes(out_of_range_threshold: float = OUT_OF_RANGE_THRESHOLD):
+    """
+    Predicados de ruteo {tabla: func(tx) -> bool} sobre una fila ya convertida.
+    top_transactions_by_user no es un predicado por fila (es un top-k por usuario)
+    y se resuelve aparte en load_transactions_fanout.
+    """
+    def is_rejected(tx):
+        return tx["state"] in REJECTED_STATES
+
+    return {
+        "transactions_by_user": lambda tx: not is_rejected(tx),
+        "transfers_by_user": lambda tx: not is_rejected(tx) and (tx["type_tx"] or "").startswith("transfer"),
+        "out_of_range_transactions": lambda tx: (
+            not is_rejected(tx) and tx["amount"] is not None and tx["amount"] >= out_of_range_threshold
+        ),
+        "rejected_attempts_by_user": is_rejected,
+    }
+
+
+def load_transactions_fanout(
+    session,
+    keyspace_name: str,
+    csv_path: str,
+    out_of_range_threshold: float = OUT_OF_RANGE_THRESHOLD,
+    top_k: int = TOP_K_PER_USER,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """
+    Lee el CSV canónico de transacciones UNA sola vez, convierte cada fila una
+    vez y la envía a todas las tablas de FANOUT_TABLES cuyo predicado cumple.
+    Todas las tablas comparten la misma ventana de execute_concurrent.
+
+    El top por usuario se mantiene con un heap de tamaño 'top_k' por user_id
+    y se escribe al final de la lectura.
+
+    :return: lista de estadísticas por tabla (en el orden de FANOUT_TABLES)
+    """
+    routes = build_fanout_routes(out_of_range_threshold)
+    writers = {
+        table: _PartitionWriter(session, keyspace_name, table, TX_COLUMNS, "user_id", batch_size)
+        for table in FANOUT_TABLES
+    }
+    leaderboards = {}   # {tabla base: _LeaderboardWriter}
+    for table in FANOUT_TABLES:
+        if table in LEADERBOARDS:
+            lb_table, sort_column = LEADERBOARDS[table]
+            leaderboards[table] = _LeaderboardWriter(
+                session, keyspace_name, lb_table, TX_COLUMNS, "user_id", sort_column, batch_size
+            )
+    amount_idx = TX_COLUMNS.index("amount")
+    top_heaps = {}   # {user_id: [(amount, tx_id, seq, valores), ...]}
+    # 'seq' desempata: heapq nunca llega a comparar las listas de valores
+    seq = itertools.count()
+
+    def flush():
+        statements = []
+        for writer in writers.values():
+            statements.extend(writer.drain())
+        for writer in leaderboards.values():
+            statements.extend(writer.drain())
+        _execute_statements(session, statements, concurrency)
+
+    start = time.perf_counter()
+    buffered = 0
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+
+        for row in reader:
+            values = convert_row(row, TX_COLUMNS, TX_CONVERTERS)
+            tx = dict(zip(TX_COLUMNS, values))
+
+            for table, predicate in routes.items():
+                if predicate(tx):
+                    writers[table].add(values)
+                    buffered += 1
+                    if table in leaderboards:
+                        leaderboards[table].add(values)
+
+            if not routes["rejected_attempts_by_user"](tx) and values[amount_idx] is not None:
+                heap = top_heaps.setdefault(tx["user_id"], [])
+                item = (values[amount_idx], tx["tx_id"] or 0, next(seq), values)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, item)
+
+            if buffered >= chunk_size:
+                flush()
+                buffered = 0
+
+    for heap in top_heaps.values():
+        for *_, values in heap:
+            writers["top_transactions_by_user"].add(values)
+    for writer in leaderboards.values():
+        writer.finish()
+    flush()
+
+    elapsed = time.perf_counter() - start
+    # El archivo se lee una vez: sus bytes se cuentan solo en la primera tabla
+    size_bytes = os.path.getsize(csv_path)
+    return [
+        _load_stats(table, writers[table].rows, size_bytes if i == 0 else 0, elapsed)
+        for i, table in enumerate(FANOUT_TABLES)
+    ]
+
+
+# ---------------------------------------------------------
+# Particiones por mes: (user_id, month) para usuarios con mucho volumen
+# ---------------------------------------------------------
+
+# {tabla base: (tabla por mes, columnas, conversores, columna de fecha, tipo en user_tx_months)}
+MONTH_BUCKET_TABLES = {
+    "transactions_by_user": ("transactions_by_user_month", TX_COLUMNS, TX_CONVERTERS, "tx_date", "sent"),
+    "received_transactions_by_user": (
+        "received_transactions_by_user_month", RECEIVED_COLUMNS, RECEIVED_CONVERTERS, "date", "received"
+    ),
+}
+
+
+def load_month_buckets(
+    session,
+    keyspace_name: str,
+    base_table: str,
+    csv_path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    row_filter=None,
+):
+    """
+    Llena la versión por mes de 'base_table' (ver MONTH_BUCKET_TABLES) desde su
+    CSV y registra cada (user_id, tipo, month) en user_tx_months, que es el
+    índice que recorren las consultas (mes más reciente primero).
+    Sirve también como migración desde los CSV existentes.
+
+    'row_filter(dict)' descarta filas (p. ej. la ruta del fan-out cuando el CSV
+    es el canónico). Las filas sin fecha se omiten y se reportan al final.
+    """
+    table, columns, converters, date_col, kind = MONTH_BUCKET_TABLES[base_table]
+    date_idx = columns.index(date_col)
+    user_idx = columns.index("user_id")
+
+    writer = _PartitionWriter(session, keyspace_name, table, ["month"] + columns, ("user_id", "month"), batch_size)
+    months_writer = _PartitionWriter(session, keyspace_name, "user_tx_months", ["user_id", "kind", "month"], "user_id")
+    seen_months = set()
+    skipped = 0
+
+    start = time.perf_counter()
+    buffered = 0
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+
+        for row in reader:
+            values = convert_row(row, columns, converters)
+            if row_filter and not row_filter(dict(zip(columns, values))):
+                continue
+            month = month_bucket(values[date_idx])
+            if month is None:
+                skipped += 1
+                continue
+            writer.add([month] + values)
+
+            key = (values[user_idx], month)
+            if key not in seen_months:
+                seen_months.add(key)
+                months_writer.add([values[user_idx], kind, month])
+
+            buffered += 1
+            if buffered >= chunk_size:
+                _execute_statements(session, writer.drain() + months_writer.drain(), concurrency)
+                buffered = 0
+
+        _execute_statements(session, writer.drain() + months_writer.drain(), concurrency)
+
+    if skipped:
+        print(f"   ⚠️ {table}: {skipped} filas sin {date_col} omitidas")
+    return _load_stats(table, writer.rows, os.path.getsize(csv_path), time.perf_counter() - start)
+
+
+# ---------------------------------------------------------
+# Carga info de todas las tablas desde CSV
+# ---------------------------------------------------------
+def _load_table_spec(session, keyspace_name: str, base_path: str, spec: dict):
+    """
+    Carga una tabla de TABLE_SPECS desde '{base_path}/{tabla}.csv'.
+    """
+    table = spec["table"]
+    print(f"   ⏳ Cargando {table}...")
+    return load_csv_into_table(
         session,
         keyspace_name,
-        "duplicate_transactions_by_user",
-        f"{base_path}/duplicate_transactions_by_user.csv",
-        ["user_id", "date", "tx_id", "account_id", "sender_acc_id", "amount", "status", "tx_type"],
-        converters={
-            "user_id": int,
-            "tx_id": int,
-            "amount": float,
-            "date": parse_date,
-        },
+        table,
+        f"{base_path}/{table}.csv",
+        spec["columns"],
+        converters=spec["converters"],
+        partition_key=spec["partition_key"],
+        leaderboard=LEADERBOARDS.get(table),
+        mirrors=MIRRORS.get(table),
     )
 
-    # 11) transaction_status_changes.csv
-    load_csv_into_table(
-        session,
-        keyspace_name,
-        "transaction_status_changes",
-        f"{base_path}/transaction_status_changes.csv",
-        ["trs_id", "account_id", "user_id", "old_status", "new_status", "change_date", "change_reason"],
-        converters={
-            "trs_id": int,
-            "user_id": int,
-            "change_date": parse_timestamp,
-        },
+
+def print_load_summary(stats: list, elapsed: float):
+    """
+    Imprime el resumen final de la carga: filas, bytes, tiempo y filas/s por tabla.
+    """
+    rows = [
+        {
+            "tabla": s["table"],
+            "filas": s["rows"],
+            "bytes": f"{s['bytes']:,}",
+            "segundos": f"{s['elapsed']:.2f}",
+            "filas/s": f"{s['rows_per_s']:,.0f}",
+        }
+        for s in stats
+    ]
+    print_table(
+        rows,
+        columns=["tabla", "filas", "bytes", "segundos", "filas/s"],
+        max_rows=len(rows),
+        title="[📦 Resumen de carga Cassandra]",
     )
+
+    total_rows = sum(s["rows"] for s in stats)
+    total_bytes = sum(s["bytes"] for s in stats)
+    rate = total_rows / elapsed if elapsed > 0 else 0.0
+    print(f"\n   Total: {total_rows} filas, {total_bytes:,} bytes en {elapsed:.2f}s ({rate:,.0f} filas/s)")
+
+
+def load_all_data(
+    session,
+    keyspace_name: str,
+    base_path: str = "data",
+    workers: int = 1,
+    fanout_path: str | None = None,
+    month_buckets: bool = False,
+):
+    """
+    Carga los datos de TODOS los CSV en sus tablas correspondientes.
+    Se asume que los archivos CSV existen en la carpeta 'base_path'.
+    Cada tabla se carga con el bulk loader concurrente (load_csv_into_table),
+    agrupando únicamente filas de la misma partición.
+
+    Las tablas son vistas independientes, así que con workers > 1 se cargan
+    en paralelo con un pool de hilos que comparte la misma Session
+    (la Session del driver es thread-safe).
+
+    Si se indica 'fanout_path' (CSV canónico de transacciones), las tablas de
+    FANOUT_TABLES se derivan de ese archivo en una sola pasada en lugar de
+    leer sus CSV individuales. Es opt-in: las reglas de ruteo no reproducen
+    exactamente los CSV curados.
+
+    Con month_buckets=True también se llenan las tablas particionadas por
+    (user_id, month) de MONTH_BUCKET_TABLES; con fan-out, las de tablas
+    derivadas salen del mismo CSV canónico y con la misma ruta.
+
+    :return: lista de estadísticas por tabla
+    """
+    start = time.perf_counter()
+
+    specs = TABLE_SPECS
+    tasks = []
+    if fanout_path:
+        specs = [spec for spec in TABLE_SPECS if spec["table"] not in FANOUT_TABLES]
+        tasks.append(lambda: load_transactions_fanout(session, keyspace_name, fanout_path))
+    for spec in specs:
+        tasks.append(lambda spec=spec: [_load_table_spec(session, keyspace_name, base_path, spec)])
+    if month_buckets:
+        routes = build_fanout_routes()
+        for base_table in MONTH_BUCKET_TABLES:
+            csv_path, row_filter = f"{base_path}/{base_table}.csv", None
+            if fanout_path and base_table in routes:
+                csv_path, row_filter = fanout_path, routes[base_table]
+            tasks.append(lambda base_table=base_table, csv_path=csv_path, row_filter=row_filter: [
+                load_month_buckets(session, keyspace_name, base_table, csv_path, row_filter=row_filter)
+            ])
+
+    if workers <= 1:
+        results = [task() for task in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(task) for task in tasks]
+            results = [fut.result() for fut in futures]
+
+    stats = [s for result in results for s in result]
+    print_load_summary(stats, time.perf_counter() - start)
+    return stats
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 from datetime import datetime, timedelta
+import heapq
+import os
 import random
+import threading
 import uuid
+import weakref
+import zlib
 import time_uuid
+from itertools import islice
 from .utils import print_table
 from cassandra.query import BatchStatement
 
@@ -180,22 +186,224 @@ CREATE_TRANSACTION_STATUS_CHANGES_TABLE = """
     ) WITH CLUSTERING ORDER BY (change_date ASC)
 """
 
+# ==========================
+# ESQUEMA OPCIONAL: PARTICIONES POR (user_id, month)
+# ==========================
+# Para usuarios con mucho volumen (comercios, nómina) la partición por user_id
+# crece sin límite. Con CASSANDRA_MONTH_BUCKETS=true las consultas de historial
+# y recibidas leen estas tablas, recorriendo los meses del más reciente al más viejo.
+# Única fuente del ajuste: populate.py lo pasa al loader para llenarlas.
+USE_MONTH_BUCKETS = os.getenv("CASSANDRA_MONTH_BUCKETS", "false").lower() == "true"
+
+
+def month_bucket(value) -> str | None:
+    """
+    Bucket 'YYYY-MM' de una fecha (date/datetime); None si no hay fecha.
+    """
+    if value is None:
+        return None
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+# Índice de meses con datos por usuario; kind = 'sent' | 'received'
+CREATE_USER_TX_MONTHS_TABLE = """
+    CREATE TABLE IF NOT EXISTS user_tx_months (
+        user_id INT,
+        kind TEXT,
+        month TEXT,
+        PRIMARY KEY ((user_id), kind, month)
+    ) WITH CLUSTERING ORDER BY (kind ASC, month DESC)
+"""
+
+#Requerimiento 1 (por mes)
+CREATE_TRANSACTIONS_BY_USER_MONTH_TABLE = """
+    CREATE TABLE IF NOT EXISTS transactions_by_user_month (
+        user_id INT,
+        month TEXT,
+        account_id TEXT,
+        tx_id INT,
+        amount DECIMAL,
+        type_tx TEXT,
+        state TEXT,
+        account_dty TEXT,
+        user_dty INT,
+        tx_date DATE,
+        PRIMARY KEY ((user_id, month), tx_date, account_id)
+    ) WITH CLUSTERING ORDER BY (tx_date DESC, account_id ASC)
+"""
+
+#Requerimiento 10 (por mes)
+CREATE_RECEIVED_TRANSACTIONS_BY_USER_MONTH_TABLE = """
+    CREATE TABLE IF NOT EXISTS received_transactions_by_user_month (
+        user_id INT,
+        month TEXT,
+        date DATE,
+        tx_id INT,
+        account_id TEXT,
+        sender_acc_id TEXT,
+        amount DECIMAL,
+        status TEXT,
+        tx_type TEXT,
+        PRIMARY KEY ((user_id, month), date, amount)
+    ) WITH CLUSTERING ORDER BY (date DESC, amount ASC)
+"""
+
+#Requerimiento 12 (consulta por usuario sin ALLOW FILTERING):
+CREATE_STATUS_CHANGES_BY_USER_TABLE = """
+    CREATE TABLE IF NOT EXISTS status_changes_by_user (
+        user_id INT,
+        change_date TIMESTAMP,
+        trs_id INT,
+        account_id TEXT,
+        old_status TEXT,
+        new_status TEXT,
+        change_reason TEXT,
+        PRIMARY KEY ((user_id), change_date, trs_id)
+    ) WITH CLUSTERING ORDER BY (change_date DESC, trs_id ASC)
+"""
+
+# ==========================
+# LEADERBOARDS GLOBALES (top-k precalculado)
+# ==========================
+# Cassandra no ordena entre particiones: las filas se reparten en
+# LEADERBOARD_BUCKETS particiones ya ordenadas DESC y el top global es una
+# mezcla k-way de los primeros 'limit' registros de cada bucket.
+# El loader guarda solo las LEADERBOARD_TOP_N mejores filas de cada bucket, así
+# que cada partición queda acotada sin importar el tamaño de la tabla base; el
+# top global es exacto hasta ese límite (más allá: las variantes *_scan).
+LEADERBOARD_BUCKETS = 16
+LEADERBOARD_TOP_N = 1000
+
+
+def leaderboard_bucket(key) -> int:
+    """
+    Bucket estable (independiente del proceso) para una clave de partición.
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % LEADERBOARD_BUCKETS
+
+
+#Requerimiento 3 (global):
+CREATE_TOP_ACCOUNTS_BY_BUCKET_TABLE = """
+    CREATE TABLE IF NOT EXISTS top_accounts_by_bucket (
+        bucket INT,
+        user_id INT,
+        account_id TEXT,
+        total_transacciones INT,
+        account_balance DECIMAL,
+        PRIMARY KEY ((bucket), total_transacciones, user_id, account_id)
+    ) WITH CLUSTERING ORDER BY (total_transacciones DESC, user_id ASC, account_id ASC)
+"""
+
+#Requerimiento 8 (global):
+CREATE_TOP_OUT_OF_RANGE_BY_BUCKET_TABLE = """
+    CREATE TABLE IF NOT EXISTS top_out_of_range_by_bucket (
+        bucket INT,
+        user_id INT,
+        account_id TEXT,
+        tx_id INT,
+        amount DECIMAL,
+        type_tx TEXT,
+        state TEXT,
+        account_dty TEXT,
+        user_dty INT,
+        tx_date DATE,
+        PRIMARY KEY ((bucket), amount, tx_id)
+    ) WITH CLUSTERING ORDER BY (amount DESC, tx_id DESC)
+"""
+
 # ==========================
 # QUERIES - REQUERIMIENTOS CASSANDRA
 # ==========================
 
+# Filas por página en los recorridos globales (paginación del lado del servidor)
+GLOBAL_FETCH_SIZE = 1000
+
+# Registro de sentencias preparadas: {session: {cql: PreparedStatement}}.
+# Cada consulta se prepara una sola vez por Session; al ejecutarla como
+# prepared el coordinador no vuelve a parsear el CQL y el driver enruta
+# directo a las réplicas de la partición (token-aware).
+_PREPARED = weakref.WeakKeyDictionary()
+_PREPARED_LOCK = threading.Lock()
+
+
+def prepared_statement(session, cql: str):
+    """
+    Devuelve la sentencia preparada de 'cql' para esta Session (la prepara la primera vez).
+    """
+    statements = _PREPARED.get(session)
+    if statements is None or cql not in statements:
+        with _PREPARED_LOCK:
+            statements = _PREPARED.setdefault(session, {})
+            if cql not in statements:
+                statements[cql] = session.prepare(cql)
+    return statements[cql]
+
+
+def _execute(session, cql: str, params=()):
+    return session.execute(prepared_statement(session, cql), params)
+
+
+def _merge_leaderboard(session, cql, limit, key):
+    """
+    Lee los primeros 'limit' registros de cada bucket en paralelo (execute_async)
+    y hace la mezcla k-way de las particiones ya ordenadas DESC.
+    'limit' se acota a LEADERBOARD_TOP_N, lo que guarda cada bucket.
+    """
+    limit = min(limit, LEADERBOARD_TOP_N)
+    prepared = prepared_statement(session, cql)
+    futures = [session.execute_async(prepared, (bucket, limit)) for bucket in range(LEADERBOARD_BUCKETS)]
+    parts = [list(fut.result()) for fut in futures]
+    return list(islice(heapq.merge(*parts, key=key, reverse=True), limit))
+
+
+def _q_por_meses(session, cql, user_id: int, kind: str, limit: int):
+    """
+    Recorre las particiones (user_id, month) del mes más reciente al más viejo
+    hasta juntar 'limit' filas. 'cql' recibe (user_id, month, limit).
+    """
+    months = _execute(
+        session,
+        "SELECT month FROM user_tx_months WHERE user_id = ? AND kind = ?",
+        (user_id, kind),
+    )
+    rows = []
+    for m in months:
+        rows.extend(_execute(session, cql, (user_id, m.month, limit - len(rows))))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _scan(session, cql, fetch_size=GLOBAL_FETCH_SIZE):
+    """
+    Recorre una consulta global página por página: el driver solo pide la
+    siguiente página (paging state) cuando se consume la anterior.
+    """
+    bound = prepared_statement(session, cql).bind(())
+    bound.fetch_size = fetch_size
+    return session.execute(bound)
+
 # 1) Historial de movimientos (Cassandra #1)
 def q_historial_transaccional(session, user_id: int, limit: int = 100):
     """
     Historial completo de movimientos de un usuario, ordenado por fecha desc y cuenta.
     """
-    cql = f"""
+    if USE_MONTH_BUCKETS:
+        cql = """
+        SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
+        FROM transactions_by_user_month
+        WHERE user_id = ? AND month = ?
+        LIMIT ?;
+        """
+        return _q_por_meses(session, cql, user_id, "sent", limit)
+
+    cql = """
     SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
     FROM transactions_by_user
-    WHERE user_id = %s
-    LIMIT {limit};
+    WHERE user_id = ?
+    LIMIT ?;
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id, limit))
 
 
 # 2) Operaciones de mayor cuantía histórica (Cassandra #2)
@@ -203,14 +411,14 @@ def q_top_operaciones_por_usuario(session, user_id: int, limit: int = 20):
     """
     Top operaciones de mayor monto para un usuario.
     """
-    cql = f"""
+    cql = """
     SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
     FROM top_transactions_by_user
-    WHERE user_id = %s
-    LIMIT {limit};
+    WHERE user_id = ?
+    LIMIT ?;
     """
 
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id, limit))
 
 
 # 3) cuentas con mayor frecuencia transaccional (Cassandra #3)
@@ -221,23 +429,34 @@ def q_cuentas_por_usuario(session, user_id: int):
     cql = """
     SELECT user_id, account_id, total_transacciones, account_balance
     FROM accounts_by_transactions
-    WHERE user_id = %s
+    WHERE user_id = ?
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id,))
 
 
 def q_top_cuentas_global(session, limit: int = 50):
     """
     Top global de cuentas por volumen/actividad.
     Cassandra no permite ORDER BY cross-partición, así que:
-      - Aquí traemos todo y el orden global se haría en Python.
+      - Se leen los buckets de top_accounts_by_bucket (ya ordenados) y se mezclan.
     Se usa en: analítica forense -> opción 1 (Top Cuentas por Volumen).
     """
+    cql = """
+    SELECT user_id, account_id, total_transacciones, account_balance
+    FROM top_accounts_by_bucket
+    WHERE bucket = ?
+    LIMIT ?;
+    """
+    return _merge_leaderboard(session, cql, limit, key=lambda r: r.total_transacciones)
+
+
+def q_top_cuentas_global_scan(session, limit: int = 50):
+    """
+    Igual que q_top_cuentas_global pero recorriendo accounts_by_transactions
+    completa (paginado + heap de tamaño 'limit'). Útil si el leaderboard no está poblado.
+    """
     cql = "SELECT user_id, account_id, total_transacciones, account_balance FROM accounts_by_transactions;"
-    rows = list(session.execute(cql))
-    # Ordenamos en Python
-    rows.sort(key=lambda r: r.total_transacciones, reverse=True)
-    return rows[:limit]
+    return heapq.nlargest(limit, _scan(session, cql), key=lambda r: r.total_transacciones)
 
 
 # 4) Transferencias internas (Cassandra #4)
@@ -248,9 +467,9 @@ def q_transferencias_por_usuario(session, user_id: int):
     cql = """
     SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
     FROM transfers_by_user
-    WHERE user_id = %s
+    WHERE user_id = ?
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id,))
 
 
 # 6) Transacciones en tiempo real / por día (Cassandra #6)
@@ -261,43 +480,55 @@ def q_realtime_por_dia(session, tx_day: str):
     cql = """
     SELECT tx_day, user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
     FROM realtime_transactions
-    WHERE tx_day = %s
+    WHERE tx_day = ?
     """
-    return session.execute(cql, (tx_day,))
+    return _execute(session, cql, (tx_day,))
 
 
 # 8) Transacciones fuera de rango/umbral (Cassandra #8)
 def q_transacciones_fuera_de_rango_global(session, limit: int = 100):
     """
-    Lista global de transacciones fuera de rango
+    Lista global de transacciones fuera de rango (mayor monto primero).
+    Mezcla k-way de los buckets de top_out_of_range_by_bucket.
+    """
+    cql = """
+    SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
+    FROM top_out_of_range_by_bucket
+    WHERE bucket = ?
+    LIMIT ?;
+    """
+    return _merge_leaderboard(session, cql, limit, key=lambda r: r.amount)
+
+
+def q_transacciones_fuera_de_rango_global_scan(session, limit: int = 100):
+    """
+    Igual que q_transacciones_fuera_de_rango_global pero recorriendo
+    out_of_range_transactions completa (paginado + heap de tamaño 'limit').
     """
     cql = "SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date FROM out_of_range_transactions;"
-    rows = list(session.execute(cql))
-    rows.sort(key=lambda r: float(r.amount), reverse=True)
-    return rows[:limit]
+    return heapq.nlargest(limit, _scan(session, cql), key=lambda r: float(r.amount))
 
 
 def q_transacciones_fuera_de_rango_usuario(session, user_id: int, limit: int = 50):
     """
     Versión filtrada por usuario.
     """
-    cql = f"""
+    cql = """
     SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
     FROM out_of_range_transactions
-    WHERE user_id = %s
-    LIMIT {limit};
+    WHERE user_id = ?
+    LIMIT ?;
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id, limit))
 
 
 # 9) Intentos de operación rechazados (Cassandra #9)
 def q_intentos_rechazados_global(session, limit: int = 100):
     """
-   trae todos los intentos rechazados / fallidos.
+   Intentos rechazados / fallidos. Sin orden: se detiene al juntar 'limit' filas.
     """
     cql = "SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date FROM rejected_attempts_by_user;"
-    rows = list(session.execute(cql))
-    return rows[:limit]
+    return list(islice(_scan(session, cql, fetch_size=min(limit, GLOBAL_FETCH_SIZE)), limit))
 
 
 def q_intentos_rechazados_usuario(session, user_id: int):
@@ -307,9 +538,9 @@ def q_intentos_rechazados_usuario(session, user_id: int):
     cql = """
     SELECT user_id, account_id, tx_id, amount, type_tx, state, account_dty, user_dty, tx_date
     FROM rejected_attempts_by_user
-    WHERE user_id = %s;
+    WHERE user_id = ?;
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id,))
 
 
 # 10) Flujo de dinero entrante (Cassandra #10)
@@ -317,23 +548,32 @@ def q_transacciones_recibidas_usuario(session, user_id: int, limit: int = 50):
     """
     Transacciones recibidas por un usuario (entrantes).
     """
-    cql = f"""
+    if USE_MONTH_BUCKETS:
+        cql = """
+        SELECT user_id, date, tx_id, account_id, sender_acc_id, amount, status, tx_type
+        FROM received_transactions_by_user_month
+        WHERE user_id = ? AND month = ?
+        LIMIT ?;
+        """
+        return _q_por_meses(session, cql, user_id, "received", limit)
+
+    cql = """
     SELECT user_id, date, tx_id, account_id, sender_acc_id, amount, status, tx_type
     FROM received_transactions_by_user
-    WHERE user_id = %s
-    LIMIT {limit};
+    WHERE user_id = ?
+    LIMIT ?;
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id, limit))
 
 
 # 11) Auditoría de duplicados (Cassandra #11)
 def q_duplicados_global(session, limit: int = 100):
     """
     Auditoría global de transacciones duplicadas.
+    Sin orden: se detiene al juntar 'limit' filas.
     """
     cql = "SELECT user_id, date, tx_id, account_id, sender_acc_id, amount, status, tx_type FROM duplicate_transactions_by_user;"
-    rows = list(session.execute(cql))
-    return rows[:limit]
+    return list(islice(_scan(session, cql, fetch_size=min(limit, GLOBAL_FETCH_SIZE)), limit))
 
 
 def q_duplicados_usuario(session, user_id: int):
@@ -343,22 +583,23 @@ def q_duplicados_usuario(session, user_id: int):
     cql = """
     SELECT user_id, date, tx_id, account_id, sender_acc_id, amount, status, tx_type
     FROM duplicate_transactions_by_user
-    WHERE user_id = %s;
+    WHERE user_id = ?;
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id,))
 
 
 # 12) Estado de transacciones en curso (Cassandra #12)
 def q_cambios_estado_por_usuario(session, user_id: int):
     """
-    Historial de cambios de estado de transacciones para un usuario.
+    Historial de cambios de estado de transacciones para un usuario
+    (lectura de una sola partición, más reciente primero).
     """
     cql = """
     SELECT trs_id, account_id, user_id, old_status, new_status, change_date, change_reason
-    FROM transaction_status_changes
-    WHERE user_id = %s ALLOW FILTERING;
+    FROM status_changes_by_user
+    WHERE user_id = ?;
     """
-    return session.execute(cql, (user_id,))
+    return _execute(session, cql, (user_id,))
 
 
 # FUNCIONES DE PRESENTACIÓN
@@ -0,0 +1,463 @@
+import csv
+import heapq
+import re
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+from .model import FILES
+from .querys import _run_query, print_header, print_separator
+
+# Detección de layering (estratificación): ciclos de dinero A -> ... -> A y
+# estructuras fan-out -> fan-in (smurfing). Dos motores con la misma lógica:
+#   - Dgraph: k-shortest paths (DQL) a partir de una cuenta.
+#   - Local: grafo CSR en memoria construido desde edges_transactions_flow.csv,
+#     para barridos masivos sobre todas las cuentas sin tocar el clúster.
+
+MAX_HOPS = 4            # cuentas distintas en un ciclo
+WINDOW_HOURS = 72       # duración máxima del patrón (primera a última transacción)
+MIN_BRANCHES = 3        # cuentas intermedias para considerar fan-out/fan-in
+MAX_FRONTIER = 1000     # caminos/aristas expandidos por salto (evita explosión en cuentas hub)
+K_PATHS = 5             # numpaths de k-shortest en Dgraph
+# Dgraph admite un solo bloque shortest por petición, así que fetch_cycles hace
+# una consulta por sucesor distinto: este es el tope de viajes por cuenta.
+MAX_PATH_QUERIES = 25
+
+_UID_RE = re.compile(r"^0x[0-9a-fA-F]+$")
+
+
+@dataclass(slots=True)
+class MoneyCycle:
+    accounts: List[str]     # A, B, ..., (regresa a A)
+    tx_ids: List[str]
+    total_amount: float
+    span_hours: float
+
+
+@dataclass(slots=True)
+class FanPattern:
+    source: str
+    intermediaries: List[str]
+    sink: str
+    tx_ids: List[str]
+    total_amount: float
+    span_hours: float
+
+
+def parse_ts(value):
+    """tx_ts (ISO 8601, con o sin 'Z') -> segundos epoch"""
+    if not value:
+        return 0.0
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def _in_order(times, window):
+    """Las transacciones van hacia adelante en el tiempo y caben en la ventana"""
+    return all(a <= b for a, b in zip(times, times[1:])) and times[-1] - times[0] <= window
+
+
+def _group_fans(source, hops, min_branches, window):
+    """
+    hops: [(tx1, mid, ts1, amount1, [(tx2, sink, ts2, amount2), ...]), ...]
+    Agrupa por cuenta destino final; hay patrón cuando al menos 'min_branches'
+    intermediarias distintas reciben de 'source' y reenvían al mismo 'sink'.
+    """
+    by_sink = {}
+    for tx1, mid, ts1, amt1, forwards in hops:
+        for tx2, sink, ts2, amt2 in forwards:
+            if sink in (source, mid) or ts2 < ts1:
+                continue
+            by_sink.setdefault(sink, {}).setdefault(mid, (tx1, tx2, ts1, ts2, amt1 + amt2))
+
+    patterns = []
+    for sink, mids in by_sink.items():
+        if len(mids) < min_branches:
+            continue
+        legs = list(mids.values())
+        start = min(leg[2] for leg in legs)
+        end = max(leg[3] for leg in legs)
+        if end - start > window:
+            continue
+        patterns.append(FanPattern(
+            source, sorted(mids), sink,
+            [tx for leg in legs for tx in leg[:2]],
+            sum(leg[4] for leg in legs),
+            (end - start) / 3600,
+        ))
+    return patterns
+
+
+# =====================================================================
+# MOTOR LOCAL: GRAFO CSR
+# =====================================================================
+
+class FlowGraph:
+    """
+    Adyacencia dirigida cuenta -> cuenta en formato CSR (compressed sparse row).
+    Las aristas de cada cuenta quedan ordenadas por tx_ts, así los recorridos
+    pueden cortar en cuanto salen de la ventana de tiempo.
+    """
+    __slots__ = ("accounts", "index", "indptr", "indices", "tx_ids", "amounts", "ts")
+
+    def __init__(self, accounts, edges):
+        # edges: [(src_idx, dst_idx, tx_id, amount, ts)]
+        self.accounts = accounts
+        self.index = {acc: i for i, acc in enumerate(accounts)}
+        edges.sort(key=lambda e: (e[0], e[4]))
+
+        self.indptr = array('l', [0]) * (len(accounts) + 1)
+        self.indices = array('l', (e[1] for e in edges))
+        self.tx_ids = [e[2] for e in edges]
+        self.amounts = array('d', (e[3] for e in edges))
+        self.ts = array('d', (e[4] for e in edges))
+
+        for src, *_ in edges:
+            self.indptr[src + 1] += 1
+        for i in range(len(accounts)):
+            self.indptr[i + 1] += self.indptr[i]
+
+    def out_edges(self, node):
+        return range(self.indptr[node], self.indptr[node + 1])
+
+    def __len__(self):
+        return len(self.accounts)
+
+
+def build_flow_graph(edges_path=FILES['rel_tx'], txs_path=FILES['txs']):
+    """Construye el FlowGraph a partir de los CSV de Dgraph (flujo + nodos de transacción)"""
+    tx_info = {}
+    with open(txs_path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            tx_info[row['tx_id'].strip()] = (float(row['amount'] or 0), parse_ts(row['tx_ts']))
+
+    index = {}
+    edges = []
+    with open(edges_path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            src, dst = (row.get('from_account') or '').strip(), (row.get('to_account') or '').strip()
+            tx_id = row['tx_id'].strip()
+            if not src or not dst or tx_id not in tx_info:
+                continue
+            amount, ts = tx_info[tx_id]
+            s = index.setdefault(src, len(index))
+            d = index.setdefault(dst, len(index))
+            edges.append((s, d, tx_id, amount, ts))
+
+    accounts = [None] * len(index)
+    for acc, i in index.items():
+        accounts[i] = acc
+    return FlowGraph(accounts, edges)
+
+
+def _bounded(items, max_frontier, key):
+    """Recorta el frente a los 'max_frontier' elementos de mayor monto"""
+    if len(items) <= max_frontier:
+        return items
+    return heapq.nlargest(max_frontier, items, key=key)
+
+
+def find_cycles(graph, start, max_hops=MAX_HOPS, window_hours=WINDOW_HOURS, max_frontier=MAX_FRONTIER):
+    """
+    Ciclos que salen de la cuenta 'start' y regresan a ella en <= max_hops
+    transacciones, con tiempos crecientes y dentro de la ventana.
+    Recorrido BFS por saltos con el frente acotado a max_frontier caminos.
+    """
+    if start not in graph.index:
+        return []
+    s = graph.index[start]
+    window = window_hours * 3600
+
+    cycles = []
+    # (nodo actual, ts primera tx, ts última tx, aristas del camino)
+    frontier = [(s, None, None, ())]
+    for _ in range(max_hops):
+        nxt = []
+        for node, t0, tlast, path in frontier:
+            visited = {graph.indices[e] for e in path}
+            for e in graph.out_edges(node):
+                t = graph.ts[e]
+                if tlast is not None and t < tlast:
+                    continue
+                if t0 is not None and t - t0 > window:
+                    break               # aristas ordenadas por tiempo
+                v = graph.indices[e]
+                if v == s:
+                    if path:
+                        cycles.append(_cycle(graph, s, path + (e,)))
+                    continue
+                if v in visited:
+                    continue
+                nxt.append((v, t if t0 is None else t0, t, path + (e,)))
+        frontier = _bounded(nxt, max_frontier, key=lambda p: graph.amounts[p[3][-1]])
+        if not frontier:
+            break
+    return cycles
+
+
+def _cycle(graph, s, path):
+    accounts = [graph.accounts[s]] + [graph.accounts[graph.indices[e]] for e in path]
+    times = [graph.ts[e] for e in path]
+    return MoneyCycle(
+        accounts,
+        [graph.tx_ids[e] for e in path],
+        sum(graph.amounts[e] for e in path),
+        (times[-1] - times[0]) / 3600,
+    )
+
+
+def find_fan_patterns(graph, source, min_branches=MIN_BRANCHES, window_hours=WINDOW_HOURS,
+                      max_frontier=MAX_FRONTIER):
+    """Fan-out desde 'source' hacia intermediarias que luego convergen (fan-in) en una misma cuenta"""
+    if source not in graph.index:
+        return []
+    s = graph.index[source]
+    window = window_hours * 3600
+
+    outs = _bounded(list(graph.out_edges(s)), max_frontier, key=lambda e: graph.amounts[e])
+    # El segundo salto comparte un solo presupuesto de 'max_frontier' aristas
+    # entre todas las intermediarias (no max_frontier por cada una)
+    per_mid = max(1, max_frontier // len(outs)) if outs else 0
+    budget = max_frontier
+    hops = []
+    for e in outs:
+        if budget <= 0:
+            break
+        mid, ts1 = graph.indices[e], graph.ts[e]
+        limit = min(per_mid, budget)
+        forwards = []
+        for e2 in graph.out_edges(mid):
+            ts2 = graph.ts[e2]
+            if ts2 < ts1:
+                continue
+            if ts2 - ts1 > window or len(forwards) >= limit:
+                break
+            forwards.append((graph.tx_ids[e2], graph.accounts[graph.indices[e2]], ts2, graph.amounts[e2]))
+        budget -= len(forwards)
+        hops.append((graph.tx_ids[e], graph.accounts[mid], ts1, graph.amounts[e], forwards))
+    return _group_fans(source, hops, min_branches, window)
+
+
+def sweep(graph, max_hops=MAX_HOPS, window_hours=WINDOW_HOURS, min_branches=MIN_BRANCHES,
+          max_frontier=MAX_FRONTIER):
+    """
+    Barrido offline de todas las cuentas del grafo.
+    Devuelve (ciclos, patrones fan); cada ciclo aparece una sola vez.
+    """
+    cycles, seen = [], set()
+    fans = []
+    for account in graph.accounts:
+        for cycle in find_cycles(graph, account, max_hops, window_hours, max_frontier):
+            key = frozenset(cycle.tx_ids)
+            if key not in seen:
+                seen.add(key)
+                cycles.append(cycle)
+        fans.extend(find_fan_patterns(graph, account, min_branches, window_hours, max_frontier))
+    return cycles, fans
+
+
+# =====================================================================
+# MOTOR DGRAPH: K-SHORTEST PATHS
+# =====================================================================
+
+def _walk_path(node):
+    """Aplana un elemento de _path_ ({uid, pred: {uid, pred: ...}}) en lista de uids"""
+    uids = []
+    while node:
+        uids.append(node['uid'])
+        nxt = None
+        for key, val in node.items():
+            if key in ('uid', '_weight_'):
+                continue
+            nxt = val[0] if isinstance(val, list) else val
+        node = nxt if isinstance(nxt, dict) else None
+    return uids
+
+
+def fetch_cycles(client, account_id, max_hops=MAX_HOPS, window_hours=WINDOW_HOURS,
+                 k=K_PATHS, max_frontier=MAX_FRONTIER, max_path_queries=MAX_PATH_QUERIES) -> List[MoneyCycle]:
+    """
+    Ciclos A -> B -> ... -> A en Dgraph: de las 'max_frontier' transferencias
+    salientes de A de mayor monto se toman los sucesores B distintos (máximo
+    'max_path_queries', en orden de monto) y para cada uno se piden los k
+    caminos más cortos de regreso a A. Las transferencias al mismo B reutilizan
+    esos caminos. La ventana de tiempo y el orden se validan al recibirlos.
+
+    Costo: 1 + min(sucesores distintos, max_path_queries) consultas.
+    """
+    query = """query succ($acc: string, $first: int) {
+      src(func: eq(account_id, $acc)) {
+        uid
+        out: ~from_account (orderdesc: amount, first: $first) {
+          tx_id
+          amount
+          tx_ts
+          to: to_account { uid account_id }
+        }
+      }
+    }"""
+    data = _run_query(client, query, {'$acc': account_id, '$first': str(int(max_frontier))}).get('src', [])
+    if not data:
+        return []
+    a_uid = data[0]['uid']
+    window = window_hours * 3600
+    depth = 2 * (max_hops - 1)      # cuenta -> tx -> cuenta: dos aristas por salto
+
+    # Sucesores distintos en orden de monto -> transferencias hacia cada uno
+    by_target = {}
+    for tx in data[0].get('out', []):
+        target = (tx.get('to') or [{}])[0]
+        b_uid = target.get('uid')
+        if not b_uid or b_uid == a_uid or not _UID_RE.match(b_uid):
+            continue
+        if b_uid in by_target or len(by_target) < max_path_queries:
+            by_target.setdefault(b_uid, []).append(tx)
+
+    cycles, seen = [], set()
+    for b_uid, txs_to_b in by_target.items():
+        path_query = """{
+          path as shortest(from: %s, to: %s, numpaths: %d, depth: %d) {
+            ~from_account
+            to_account
+          }
+          nodes(func: uid(path)) { uid account_id tx_id amount tx_ts }
+        }""" % (b_uid, a_uid, int(k), depth)
+        res = _run_query(client, path_query)
+        nodes = {n['uid']: n for n in res.get('nodes', [])}
+        paths = [[nodes.get(uid, {}) for uid in _walk_path(p)] for p in res.get('_path_', [])]
+
+        for tx in txs_to_b:
+            for steps in paths:
+                txs = [tx] + [n for n in steps if 'tx_id' in n]
+                accounts = [account_id] + [n['account_id'] for n in steps if 'account_id' in n]
+                times = [parse_ts(t.get('tx_ts')) for t in txs]
+                key = tuple(t['tx_id'] for t in txs)
+                if key in seen or not _in_order(times, window):
+                    continue
+                seen.add(key)
+                cycles.append(MoneyCycle(
+                    accounts, list(key), sum(t.get('amount', 0) for t in txs), (times[-1] - times[0]) / 3600,
+                ))
+    return cycles
+
+
+def fetch_fan_patterns(client, account_id, min_branches=MIN_BRANCHES, window_hours=WINDOW_HOURS,
+                       max_frontier=MAX_FRONTIER) -> List[FanPattern]:
+    """
+    Fan-out/fan-in desde una cuenta en dos consultas: las 'max_frontier'
+    salidas de mayor monto y, para sus intermediarias distintas, los reenvíos
+    posteriores a la primera salida. Ambos saltos comparten el mismo
+    presupuesto: cada intermediaria pide max(1, max_frontier // intermediarias)
+    aristas y se deja de expandir al agotar 'max_frontier'.
+    """
+    query = """query fan($acc: string, $first: int) {
+      fan(func: eq(account_id, $acc)) {
+        out: ~from_account (orderdesc: amount, first: $first) {
+          tx_id
+          amount
+          tx_ts
+          mid: to_account { uid account_id }
+        }
+      }
+    }"""
+    data = _run_query(client, query, {'$acc': account_id, '$first': str(int(max_frontier))}).get('fan', [])
+    if not data:
+        return []
+
+    outs = []
+    for tx in data[0].get('out', []):
+        mid = (tx.get('mid') or [{}])[0]
+        if 'account_id' in mid and _UID_RE.match(mid.get('uid', '')):
+            outs.append((tx, mid))
+    if not outs:
+        return []
+
+    mid_uids = list(dict.fromkeys(mid['uid'] for _, mid in outs))
+    per_mid = max(1, int(max_frontier) // len(mid_uids))
+    since = min((tx.get('tx_ts') for tx, _ in outs if tx.get('tx_ts')), key=parse_ts, default=None)
+    params, fwd_filter = "$first: int", ""
+    if since:
+        params, fwd_filter = params + ", $since: string", "@filter(ge(tx_ts, $since))"
+    fwd_query = """query fwd(%s) {
+      mids(func: uid(%s)) {
+        uid
+        fwd: ~from_account (orderasc: tx_ts, first: $first) %s {
+          tx_id
+          amount
+          tx_ts
+          sink: to_account { account_id }
+        }
+      }
+    }""" % (params, ", ".join(mid_uids), fwd_filter)
+    variables = {'$first': str(per_mid)}
+    if since:
+        variables['$since'] = str(since)
+    fwd_by_mid = {m['uid']: m.get('fwd', []) for m in _run_query(client, fwd_query, variables).get('mids', [])}
+
+    budget = int(max_frontier)
+    hops = []
+    for tx, mid in outs:
+        if budget <= 0:
+            break
+        ts1 = parse_ts(tx.get('tx_ts'))
+        forwards = []
+        for f in fwd_by_mid.get(mid['uid'], []):
+            if len(forwards) >= min(per_mid, budget):
+                break
+            ts2 = parse_ts(f.get('tx_ts'))
+            if f.get('sink') and ts2 >= ts1:
+                forwards.append((f['tx_id'], f['sink'][0]['account_id'], ts2, f.get('amount', 0)))
+        budget -= len(forwards)
+        hops.append((tx['tx_id'], mid['account_id'], ts1, tx.get('amount', 0), forwards))
+    return _group_fans(account_id, hops, min_branches, window_hours * 3600)
+
+
+# =====================================================================
+# PRESENTADORES
+# =====================================================================
+
+def print_layering(title, cycles, fans):
+    print_header(title)
+    print(f"🔁 CICLOS DE DINERO: {len(cycles)}")
+    for c in cycles:
+        print(f"   {' -> '.join(c.accounts)}")
+        print(f"      TXs: {', '.join(c.tx_ids)} | Total: ${c.total_amount:,.2f} | {c.span_hours:.1f} h")
+    print_separator()
+    print(f"🕸️  FAN-OUT / FAN-IN: {len(fans)}")
+    for f in fans:
+        print(f"   {f.source} => [{', '.join(f.intermediaries)}] => {f.sink}")
+        print(f"      Total: ${f.total_amount:,.2f} | {f.span_hours:.1f} h")
+    if not cycles and not fans:
+        print("✅ No se detectaron estructuras de estratificación.")
+
+
+def fetch_layering(client, account_id, max_hops=MAX_HOPS, window_hours=WINDOW_HOURS):
+    """Ciclos y fan-out/fan-in de una cuenta usando el motor Dgraph"""
+    return {
+        "cycles": fetch_cycles(client, account_id, max_hops, window_hours),
+        "fans": fetch_fan_patterns(client, account_id, window_hours=window_hours),
+    }
+
+
+def query_layering(client, account_id, max_hops=MAX_HOPS, window_hours=WINDOW_HOURS):
+    result = fetch_layering(client, account_id, max_hops, window_hours)
+    cycles, fans = result["cycles"], result["fans"]
+    print_layering(f"LAYERING - Origen: {account_id}", cycles, fans)
+    return cycles, fans
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Barrido offline de layering sobre el CSV de flujo")
+    parser.add_argument("--edges", default=FILES['rel_tx'])
+    parser.add_argument("--txs", default=FILES['txs'])
+    parser.add_argument("--max-hops", type=int, default=MAX_HOPS)
+    parser.add_argument("--window-hours", type=float, default=WINDOW_HOURS)
+    parser.add_argument("--min-branches", type=int, default=MIN_BRANCHES)
+    parser.add_argument("--max-frontier", type=int, default=MAX_FRONTIER)
+    args = parser.parse_args()
+
+    graph = build_flow_graph(args.edges, args.txs)
+    cycles, fans = sweep(graph, args.max_hops, args.window_hours, args.min_branches, args.max_frontier)
+    print_layering(f"LAYERING (barrido de {len(graph)} cuentas)", cycles, fans)
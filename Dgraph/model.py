@@ -2,24 +2,26 @@ import csv
 import json
 import sys
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import pydgraph
 
 #Funcion para cargar schema a dgraph
 def create_schema(client):
     schema = """
     # --- 1. Identificadores
-    user_id: string @index(hash) .
-    account_id: string @index(hash) .
-    device_id: string @index(hash) .
-    ip_addr: string .  
-    tx_id: string .
-    document_id: string .
+    user_id: string @index(hash) @upsert .
+    account_id: string @index(hash) @upsert .
+    device_id: string @index(hash) @upsert .
+    ip_addr: string @index(hash) @upsert .
+    tx_id: string @index(hash) @upsert .
+    document_id: string @index(hash) @upsert .
 
     # --- 2. Datos Numéricos
     balance: float @index(float) .
     amount: float @index(float) .
     risk_score: float .
-    tx_ts: datetime .
+    tx_ts: datetime @index(hour) .   # Ventanas de tiempo en Lavado de Dinero
     ip_reputation: int .
 
     # --- 3. Datos Geográficos
@@ -41,8 +43,9 @@ def create_schema(client):
     owns_account: [uid] @reverse .   # Usado en Lavado de Dinero (Transaction -> Account -> User)
     has_document: [uid] @reverse .   # Usado en Suplantación (Document -> User)
     uses_device: [uid] @reverse .    # Usado en Anillos de Fraude (Device -> User)
-    from_account: [uid] @reverse .   # Usado en Cuentas Fantasma y Trace Flow
-    to_account: [uid] @reverse .     # Usado en Cuentas Fantasma y Trace Flow
+    # @count: count(~from_account)/count(~to_account) se leen del índice (Cuentas Fantasma)
+    from_account: [uid] @reverse @count .   # Usado en Cuentas Fantasma y Trace Flow
+    to_account: [uid] @reverse @count .     # Usado en Cuentas Fantasma y Trace Flow
     
     known_ips: [uid] .
     has_ip: [uid] .
@@ -202,63 +205,206 @@ def tf_tx(row):
         'associated_location': loc
     }
 
+#Funciones de carga por bloques (chunks)
+
+NODES_PER_CHUNK = 1000    # ~5-10k nquads por mutación según el tipo de nodo
+EDGES_PER_CHUNK = 5000    # aristas por mutación
+UPSERTS_PER_CHUNK = 500   # nodos por bloque upsert (un var(eq(xid)) por nodo)
+LOAD_WORKERS = 4          # transacciones de chunk concurrentes
+MAX_RETRIES = 5           # reintentos ante transacciones abortadas
+RETRY_BACKOFF = 0.2       # segundos; se duplica en cada reintento
+
+def iter_chunks(items, size):
+    """Agrupa un iterable en listas de tamaño 'size' sin materializarlo completo"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def mutate_chunk(client, batch, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """Aplica un chunk en su propia transacción (commit_now) y reintenta con backoff si aborta"""
+    for attempt in range(retries + 1):
+        txn = client.txn()
+        try:
+            return txn.mutate(set_obj=batch, commit_now=True)
+        except (pydgraph.AbortedError, pydgraph.RetriableError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+        finally:
+            txn.discard()
+
+def upsert_chunk(client, batch, id_pred, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """
+    Aplica un chunk como UN bloque upsert: cada nodo se busca por eq(id_pred, xid)
+    y se crea solo si no existe. Devuelve ({xid: uid}, nodos_creados).
+    """
+    # Un mismo xid repetido en el chunk crearía dos nodos: nos quedamos con el último
+    by_xid = {obj[id_pred]: obj for obj in batch}
+
+    var_lines = []
+    objs = []
+    var_to_xid = {}
+    for i, (xid, obj) in enumerate(by_xid.items()):
+        var = f"n{i}"
+        var_lines.append(f"{var} as var(func: eq({id_pred}, {json.dumps(xid)}))")
+        objs.append({**obj, 'uid': f"uid({var})"})
+        var_to_xid[var] = xid
+
+    query = "{\n  " + "\n  ".join(var_lines) + f"""
+  existing(func: eq({id_pred}, {json.dumps(list(by_xid))})) {{
+    uid
+    xid: {id_pred}
+  }}
+}}"""
+
+    for attempt in range(retries + 1):
+        txn = client.txn()
+        try:
+            mu = txn.create_mutation(set_obj=objs)
+            request = txn.create_request(query=query, mutations=[mu], commit_now=True)
+            resp = txn.do_request(request)
+
+            uids = {n['xid']: n['uid'] for n in json.loads(resp.json).get('existing', [])}
+            created = 0
+            # Los nodos nuevos llegan en resp.uids con la llave 'uid(nX)'
+            for key, uid in resp.uids.items():
+                xid = var_to_xid.get(key[4:-1]) if key.startswith('uid(') else None
+                if xid is not None and xid not in uids:
+                    uids[xid] = uid
+                    created += 1
+            return uids, created
+        except (pydgraph.AbortedError, pydgraph.RetriableError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+        finally:
+            txn.discard()
+
+def run_chunks(client, chunks, on_response=None, workers=LOAD_WORKERS, mutate=mutate_chunk):
+    """
+    Ejecuta 'mutate(client, batch)' para cada chunk con hasta 'workers'
+    transacciones en vuelo. 'on_response(batch, resp)' se llama en el hilo
+    principal, así los mapas de UIDs no se comparten entre hilos.
+    """
+    in_flight = {}
+
+    def collect(fut):
+        batch = in_flight.pop(fut)
+        resp = fut.result()
+        if on_response:
+            on_response(batch, resp)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in chunks:
+            in_flight[pool.submit(mutate, client, batch)] = batch
+            # Ventana acotada: no leer más del CSV mientras haya demasiados chunks pendientes
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    collect(fut)
+
+        for fut in as_completed(list(in_flight)):
+            collect(fut)
+
 #Funciones de carga de nodos y aristas
 
-def load_generic_nodes(client, file_path, node_type, id_col, transform_func):
-    """Carga un CSV de nodos y devuelve un diccionario {ID_CSV: UID_DGRAPH}"""
+def load_generic_nodes(client, file_path, node_type, id_col, transform_func, chunk_size=None,
+                       uid_store=None, update_existing=False, upsert=False):
+    """
+    Carga un CSV de nodos por chunks y devuelve un diccionario {ID_CSV: UID_DGRAPH}.
+    Con 'uid_store' los nodos ya registrados no se vuelven a crear: se omiten o,
+    con update_existing=True, se actualizan sobre su UID existente.
+    Con upsert=True cada chunk es un bloque upsert sobre eq(id_col): la carga es
+    idempotente aunque no haya uid_store (o esté desactualizado). En ese modo
+    todas las filas pasan por el upsert y el store se refresca con la respuesta.
+    """
+    if chunk_size is None:
+        chunk_size = UPSERTS_PER_CHUNK if upsert else NODES_PER_CHUNK
     print(f"📂 Cargando {node_type}s desde {os.path.basename(file_path)}...")
-    txn = client.txn()
-    uids_map = {}
+    uids_map = uid_store.get_map(node_type) if uid_store else {}
+    existing = len(uids_map)
+    created = 0
+    matched = 0   # nodos que el upsert encontró ya creados en Dgraph
 
     reader, f = safe_read_csv(file_path)
     if f is None: return {}
 
-    try:
-        batch = []
+    def rows_to_objs():
         for row in reader:
             try:
-                row_id = row[id_col]
-                bnode = '_:' + get_bnode_key(row_id)
+                row_id = get_bnode_key(row[id_col])
+                known_uid = uids_map.get(row_id)
+                # Con upsert no se confía en el store: Dgraph confirma cada xid
+                if known_uid and not update_existing and not upsert:
+                    continue
 
                 obj = transform_func(row)
-                obj['uid'] = bnode
+                if not upsert:
+                    obj['uid'] = known_uid or '_:' + row_id
                 obj['dgraph.type'] = node_type
-                batch.append(obj)
+                yield obj
             except Exception as e:
                 print(f"   ⚠️ Error transformando fila: {e}")
 
-        if batch:
-            resp = txn.mutate(set_obj=batch)
-
-            # Crear mapa de UIDs reales devueltos por Dgraph
-            for item in batch:
-                original_key = item['uid'].replace('_:', '')
-                # Obtener UID real (buscando por bnode key o string key)
-                real_uid = resp.uids.get(item['uid']) or resp.uids.get(original_key)
+    def merge_uids(batch, resp):
+        nonlocal created, matched
+        if upsert:
+            new_uids, n_created = resp
+            uids_map.update(new_uids)
+            created += n_created
+            matched += len(new_uids) - n_created
+            if uid_store and new_uids:
+                uid_store.put_many(node_type, new_uids)
+            return
+
+        new_uids = {}
+        # Crear mapa de UIDs reales devueltos por Dgraph
+        for item in batch:
+            if not item['uid'].startswith('_:'):
+                continue
+            original_key = item['uid'].replace('_:', '')
+            # Obtener UID real (buscando por bnode key o string key)
+            real_uid = resp.uids.get(item['uid']) or resp.uids.get(original_key)
+
+            if real_uid:
+                new_uids[original_key] = real_uid
+
+        uids_map.update(new_uids)
+        created += len(new_uids)
+        # Persistir por chunk: una carga interrumpida se reanuda donde quedó
+        if uid_store and new_uids:
+            uid_store.put_many(node_type, new_uids)
 
-                if real_uid:
-                    uids_map[original_key] = real_uid
-
-        txn.commit()
-        print(f"   ✅ {len(uids_map)} nodos insertados.")
+    try:
+        mutate = (lambda c, batch: upsert_chunk(c, batch, id_col)) if upsert else mutate_chunk
+        run_chunks(client, iter_chunks(rows_to_objs(), chunk_size), merge_uids, mutate=mutate)
+        # Con upsert, 'matched' ya incluye los nodos que estaban en el store
+        previous = matched if upsert else existing
+        if previous:
+            print(f"   ✅ {created} nodos insertados ({previous} ya existían).")
+        else:
+            print(f"   ✅ {created} nodos insertados.")
     except Exception as e:
         print(f"❌ Error crítico cargando nodos: {e}")
     finally:
-        txn.discard()
         if f: f.close()
 
     return uids_map
 
-def load_simple_edges(client, file_path, source_map, target_map, src_col, tgt_col, edge_name):
+def load_simple_edges(client, file_path, source_map, target_map, src_col, tgt_col, edge_name, chunk_size=EDGES_PER_CHUNK):
     """Carga relaciones simples (1-1, 1-N) leyendo IDs y buscando sus UIDs en los mapas"""
     print(f"🔗 Conectando '{edge_name}' desde {os.path.basename(file_path)}...")
-    txn = client.txn()
     count = 0
     reader, f = safe_read_csv(file_path)
     if f is None: return
 
-    try:
-        batch = []
+    def rows_to_edges():
+        nonlocal count
         for row in reader:
             s_key = get_bnode_key(row.get(src_col))
             t_key = get_bnode_key(row.get(tgt_col))
@@ -267,15 +413,15 @@ def load_simple_edges(client, file_path, source_map, target_map, src_col, tgt_co
             t_uid = target_map.get(t_key)
 
             if s_uid and t_uid:
-                batch.append({
+                count += 1
+                yield {
                     'uid': s_uid,
                     edge_name: {'uid': t_uid}
-                })
-                count += 1
+                }
 
-        if batch:
-            txn.mutate(set_obj=batch)
-            txn.commit()
+    try:
+        run_chunks(client, iter_chunks(rows_to_edges(), chunk_size))
+        if count:
             print(f"   ✅ {count} relaciones creadas.")
         else:
             print(f"   ⚠️  No se encontraron coincidencias para '{edge_name}'.")
@@ -283,19 +429,17 @@ def load_simple_edges(client, file_path, source_map, target_map, src_col, tgt_co
     except Exception as e:
         print(f"❌ Error cargando aristas: {e}")
     finally:
-        txn.discard()
         if f: f.close()
 
-def load_tx_flows(client, file_path, tx_map, acc_map, dev_map, ip_map):
+def load_tx_flows(client, file_path, tx_map, acc_map, dev_map, ip_map, chunk_size=EDGES_PER_CHUNK):
     """Carga el grafo complejo de transacciones (Tx -> Account, Device, IP)"""
     print(f"🔀 Conectando Flujo de Transacciones desde {os.path.basename(file_path)}...")
-    txn = client.txn()
     count = 0
     reader, f = safe_read_csv(file_path)
     if f is None: return
 
-    try:
-        batch = []
+    def rows_to_flows():
+        nonlocal count
         for row in reader:
             tx_key = get_bnode_key(row['tx_id'])
             tx_uid = tx_map.get(tx_key)
@@ -317,45 +461,75 @@ def load_tx_flows(client, file_path, tx_map, acc_map, dev_map, ip_map):
             if row.get('used_ip') in ip_map:
                 mu['used_ip'] = {'uid': ip_map[row['used_ip']]}
 
-            batch.append(mu)
             count += 1
+            yield mu
 
-        if batch:
-            txn.mutate(set_obj=batch)
-            txn.commit()
+    try:
+        run_chunks(client, iter_chunks(rows_to_flows(), chunk_size))
+        if count:
             print(f"   ✅ {count} flujos conectados.")
     except Exception as e:
         print(f"❌ Error en flujos: {e}")
     finally:
-        txn.discard()
         if f: f.close()
 
 #Load data para usar los uids generados y cargarlos a dgraph con las respectivas relaciones
 
-def load_data(client):
+# Tipos de nodo: (clave en FILES, dgraph.type, columna ID, transformación)
+NODE_SPECS = [
+    ('users', 'User', 'user_id', tf_user),
+    ('accounts', 'Account', 'account_id', tf_account),
+    ('devices', 'Device', 'device_id', tf_device),
+    ('ips', 'IpAddress', 'ip_addr', tf_ip),
+    ('docs', 'Document', 'document_id', tf_doc),
+    ('txs', 'Transaction', 'tx_id', tf_tx),
+]
+
+def load_nodes(client, uid_store=None, upsert=False, files=None):
+    """Carga todos los nodos y devuelve {clave FILES: {ID_CSV: UID_DGRAPH}}"""
+    files = {**FILES, **(files or {})}
+    return {
+        key: load_generic_nodes(client, files[key], node_type, id_col, tf, uid_store=uid_store, upsert=upsert)
+        for key, node_type, id_col, tf in NODE_SPECS
+    }
+
+def load_uid_maps(uid_store):
+    """Reconstruye los mapas de UIDs desde el almacén persistente (sin tocar Dgraph)"""
+    return {key: uid_store.get_map(node_type) for key, node_type, _, _ in NODE_SPECS}
+
+def load_edges(client, uids, files=None):
+    """Carga todas las relaciones usando los mapas de UIDs"""
+    files = {**FILES, **(files or {})}
+    load_simple_edges(client, files['rel_acc'], uids['users'], uids['accounts'], 'user_id', 'account_id', 'owns_account')
+    load_simple_edges(client, files['rel_dev'], uids['users'], uids['devices'], 'user_id', 'device_id', 'uses_device')
+    load_simple_edges(client, files['rel_ip'], uids['users'], uids['ips'], 'user_id', 'ip_addr', 'known_ips')
+    load_simple_edges(client, files['rel_doc'], uids['users'], uids['docs'], 'user_id', 'document_id', 'has_document')
+    load_simple_edges(client, files['rel_dev_ip'], uids['devices'], uids['ips'], 'device_id', 'ip_addr', 'has_ip')
+    load_tx_flows(client, files['rel_tx'], uids['txs'], uids['accounts'], uids['devices'], uids['ips'])
+
+def load_data(client, uid_store=None, edges_only=False, upsert=False, files=None):
     """
     Función maestra que orquesta toda la carga.
     Recibe tu objeto 'client' de Dgraph ya conectado.
+    Con 'uid_store' (UidStore) los nodos ya cargados no se duplican y,
+    con edges_only=True, solo se cargan las relaciones usando el mapa guardado.
+    Con upsert=True los nodos se insertan con bloques upsert por xid (idempotente).
+    'files' permite sustituir rutas de FILES, p. ej. con los CSV de un delta diario.
     """
     print(f"\n🚀 INICIANDO CARGA DE DATOS")
     print(f"📂 Ruta de datos detectada: {DATA_PATH}\n")
 
     # 1. LOAD NODES (y obtener mapas de UIDs)
-    uids_users = load_generic_nodes(client, FILES['users'], 'User', 'user_id', tf_user)
-    uids_accounts = load_generic_nodes(client, FILES['accounts'], 'Account', 'account_id', tf_account)
-    uids_devices = load_generic_nodes(client, FILES['devices'], 'Device', 'device_id', tf_device)
-    uids_ips = load_generic_nodes(client, FILES['ips'], 'IpAddress', 'ip_addr', tf_ip)
-    uids_docs = load_generic_nodes(client, FILES['docs'], 'Document', 'document_id', tf_doc)
-    uids_txs = load_generic_nodes(client, FILES['txs'], 'Transaction', 'tx_id', tf_tx)
+    if edges_only:
+        if uid_store is None:
+            raise ValueError("edges_only requiere un uid_store con los nodos ya cargados")
+        uids = load_uid_maps(uid_store)
+    else:
+        uids = load_nodes(client, uid_store, upsert=upsert, files=files)
 
     print("\n--- NODOS LISTOS. VINCULANDO RELACIONES ---\n")
 
     # 2. LOAD EDGES (usando los mapas de UIDs)
-    load_simple_edges(client, FILES['rel_acc'], uids_users, uids_accounts, 'user_id', 'account_id', 'owns_account')
-    load_simple_edges(client, FILES['rel_dev'], uids_users, uids_devices, 'user_id', 'device_id', 'uses_device')
-    load_simple_edges(client, FILES['rel_ip'], uids_users, uids_ips, 'user_id', 'ip_addr', 'known_ips')
-    load_simple_edges(client, FILES['rel_doc'], uids_users, uids_docs, 'user_id', 'document_id', 'has_document')
-    load_simple_edges(client, FILES['rel_dev_ip'], uids_devices, uids_ips, 'device_id', 'ip_addr', 'has_ip')
-    load_tx_flows(client, FILES['rel_tx'], uids_txs, uids_accounts, uids_devices, uids_ips)
+    load_edges(client, uids, files=files)
 
     print("\n🎉 CARGA COMPLETADA EXITOSAMENTE.")
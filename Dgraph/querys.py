@@ -1,4 +1,6 @@
 import json
+from dataclasses import dataclass, field
+from typing import List, Optional
 import pydgraph
 
 # UTILERÍAS DE VISUALIZACIÓN
@@ -11,9 +13,126 @@ def print_header(title):
 def print_separator():
     print(f"{'-'*60}")
 
-# CONSULTAS DE DETECCIÓN DE FRAUDE
+# TIPOS DE RESULTADO
+# Las funciones fetch_* devuelven estos objetos sin imprimir nada; las
+# funciones query_* son solo presentadores de consola sobre ellas.
 
-def query_fraud_ring(client, device_id):
+@dataclass(slots=True)
+class LinkedUser:
+    user_id: str
+    name: str
+    risk_score: float = 0
+
+
+@dataclass(slots=True)
+class RingUser:
+    user_id: str
+    name: str
+    risk_score: float = 0
+    is_flagged: bool = False
+    ips: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class FraudRing:
+    device_id: str
+    location: str
+    users: List[RingUser]
+
+
+@dataclass(slots=True)
+class LaunderingTransfer:
+    tx_id: str
+    amount: float
+    tx_ts: str
+    source_account: str
+    source_owner: str
+    target_account: str
+    target_owner: str
+
+
+@dataclass(slots=True)
+class GhostAccount:
+    account_id: str
+    balance: float
+    risk_score: float
+    incoming_count: int
+    outgoing_count: int
+
+    @property
+    def total(self):
+        return self.incoming_count + self.outgoing_count
+
+
+@dataclass(slots=True)
+class SharedDocument:
+    document_id: str
+    doc_type: str
+    users: List[LinkedUser]
+
+
+@dataclass(slots=True)
+class PathNode:
+    node_type: str                 # 'Account', 'Transaction' o 'Unknown'
+    account_id: Optional[str] = None
+    balance: Optional[float] = None
+    tx_id: Optional[str] = None
+    amount: Optional[float] = None
+    is_flagged: bool = False
+    edge: Optional[str] = None     # predicado por el que se llegó al nodo
+    children: List["PathNode"] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class SharedDevice:
+    device_id: str
+    used_by_others: List[LinkedUser]
+
+
+@dataclass(slots=True)
+class IpReputation:
+    ip_addr: str
+    reputation: float = 0
+
+
+@dataclass(slots=True)
+class RiskContext:
+    user_id: str
+    name: str
+    risk_score: float
+    devices: List[SharedDevice]
+    ips: List[IpReputation]
+
+
+@dataclass(slots=True)
+class GeoTransaction:
+    tx_id: str
+    amount: float
+    device_id: str
+    coordinates: object
+
+
+def _run_query(client, query, variables=None):
+    """Ejecuta una consulta de solo lectura y devuelve el JSON decodificado"""
+    txn = client.txn(read_only=True)
+    try:
+        res = txn.query(query, variables=variables)
+        return json.loads(res.json)
+    finally:
+        txn.discard()
+
+
+def _linked_user(u):
+    return LinkedUser(u['user_id'], u['name'], u.get('risk_score', 0))
+
+
+# CONSULTAS DE DETECCIÓN DE FRAUDE (capa de datos)
+
+# Tamaño de página por defecto de las consultas paginadas
+GHOST_PAGE_SIZE = 100
+LAUNDERING_PAGE_SIZE = 100
+
+def fetch_fraud_ring(client, device_id) -> Optional[FraudRing]:
     """
     Requerimiento: Detección de Colaboración Fraudulenta / Anillos.
     """
@@ -30,118 +149,109 @@ def query_fraud_ring(client, device_id):
         }
       }
     }"""
-    variables = {'$dev_id': device_id}
-
-    print_header(f"ANILLO DE FRAUDE (Dispositivo: {device_id})")
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query, variables=variables)
-        data = json.loads(res.json).get('fraud_ring', [])
-
-        if not data:
-            print("✅ No se encontró el dispositivo o no tiene usuarios asociados.")
-            return
-
-        device = data[0]
-        users = device.get('used_by', [])
-
-        print(f"📍 Ubicación Disp: {device.get('device_location', 'N/A')}")
-        print(f"👥 Usuarios compartiendo este dispositivo: {len(users)}")
-        print_separator()
-        print(f"{'USER ID':<10} | {'NOMBRE':<20} | {'RISK':<5} | {'FLAG':<5} | {'IPS CONOCIDAS'}")
-        print_separator()
-
-        for u in users:
-            ips = ", ".join([ip['ip_addr'] for ip in u.get('known_ips', [])])
-            flag = "🚩" if u.get('is_flagged') else "OK"
-            print(f"{u['user_id']:<10} | {u['name']:<20} | {u['risk_score']:<5} | {flag:<5} | {ips}")
-
-    finally:
-        txn.discard()
-
-
-def query_money_laundering_pattern(client, min_amount):
+    data = _run_query(client, query, {'$dev_id': device_id}).get('fraud_ring', [])
+    if not data:
+        return None
+
+    device = data[0]
+    users = [
+        RingUser(
+            u['user_id'], u['name'], u.get('risk_score', 0), bool(u.get('is_flagged')),
+            [ip['ip_addr'] for ip in u.get('known_ips', [])],
+        )
+        for u in device.get('used_by', [])
+    ]
+    return FraudRing(device.get('device_id', device_id), device.get('device_location', 'N/A'), users)
+
+
+def fetch_money_laundering_pattern(client, min_amount, since=None, until=None,
+                                   first=LAUNDERING_PAGE_SIZE, offset=0) -> List[LaunderingTransfer]:
     """
     Requerimiento: Detección de Lavado de Dinero.
+    La raíz usa el índice de amount (ge) en lugar de recorrer type(Transaction),
+    así el costo depende del número de resultados y no del tamaño del grafo.
+    'since'/'until' (ISO 8601) acotan opcionalmente tx_ts con su índice datetime.
     """
-    query = """query laundering($min_amt: float) {
-      suspicious_transfers(func: type(Transaction)) @filter(ge(amount, $min_amt)) {
+    filters = ["type(Transaction)"]
+    params = ["$min_amt: float", "$first: int", "$offset: int"]
+    variables = {
+        '$min_amt': str(min_amount),
+        '$first': str(int(first)),
+        '$offset': str(int(offset)),
+    }
+    if since:
+        filters.append("ge(tx_ts, $since)")
+        params.append("$since: string")
+        variables['$since'] = str(since)
+    if until:
+        filters.append("le(tx_ts, $until)")
+        params.append("$until: string")
+        variables['$until'] = str(until)
+
+    query = """query laundering(%s) {
+      suspicious_transfers(func: ge(amount, $min_amt), orderdesc: amount, first: $first, offset: $offset)
+        @filter(%s) {
         tx_id
         amount
         tx_ts
         source: from_account { account_id, owner: ~owns_account { name } }
         target: to_account { account_id, owner: ~owns_account { name } }
       }
-    }"""
-    variables = {'$min_amt': str(min_amount)}
-
-    print_header(f"POSIBLE LAVADO (Montos >= ${min_amount})")
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query, variables=variables)
-        txs = json.loads(res.json).get('suspicious_transfers', [])
-
-        if not txs:
-            print("✅ No se detectaron transacciones sospechosas por ese monto.")
-            return
-
-        print(f"{'FECHA':<12} | {'TX ID':<10} | {'MONTO ($)':<12} | {'ORIGEN (Cuenta/Dueño)':<30} | {'DESTINO (Cuenta/Dueño)'}")
-        print_separator()
-
-        for tx in txs:
-
-            src_acc = tx.get('source', [{}])[0]
-            tgt_acc = tx.get('target', [{}])[0]
-
-            src_str = f"{src_acc.get('account_id', 'EXT')} ({src_acc.get('owner', [{'name':'Unknown'}])[0]['name']})"
-            tgt_str = f"{tgt_acc.get('account_id', 'EXT')} ({tgt_acc.get('owner', [{'name':'Unknown'}])[0]['name']})"
-
-            print(f"{tx['tx_ts'][:10]:<12} | {tx['tx_id']:<10} | ${tx['amount']:<11.2f} | {src_str[:29]:<30} | {tgt_str}")
-
-    finally:
-        txn.discard()
-
-
-def query_ghost_accounts(client, max_balance, min_txs):
+    }""" % (", ".join(params), " AND ".join(filters))
+    txs = _run_query(client, query, variables).get('suspicious_transfers', [])
+
+    transfers = []
+    for tx in txs:
+        src_acc = tx.get('source', [{}])[0]
+        tgt_acc = tx.get('target', [{}])[0]
+        transfers.append(LaunderingTransfer(
+            tx['tx_id'], tx['amount'], tx['tx_ts'],
+            src_acc.get('account_id', 'EXT'), src_acc.get('owner', [{'name': 'Unknown'}])[0]['name'],
+            tgt_acc.get('account_id', 'EXT'), tgt_acc.get('owner', [{'name': 'Unknown'}])[0]['name'],
+        ))
+    return transfers
+
+
+def fetch_ghost_accounts(client, max_balance, min_txs, first=GHOST_PAGE_SIZE, offset=0) -> List[GhostAccount]:
     """
     Requerimiento: Detección de Cuentas Fantasma.
+    El umbral de actividad se evalúa en Dgraph (variables de valor), así que
+    solo viajan por gRPC las cuentas que cumplen, ordenadas por flujo total
+    y paginadas con first/offset.
     """
-    query = """query ghost_acc($max_bal: float) {
-      ghost_accounts(func: le(balance, $max_bal)) @filter(type(Account)) {
+    query = """query ghost_acc($max_bal: float, $min_txs: int, $first: int, $offset: int) {
+      var(func: le(balance, $max_bal)) @filter(type(Account)) {
+        inc as count(~to_account)
+        out as count(~from_account)
+        total as math(inc + out)
+      }
+
+      ghost_accounts(func: uid(total), orderdesc: val(total), first: $first, offset: $offset)
+        @filter(ge(val(total), $min_txs)) {
         account_id
         balance
         risk_score
-        incoming_count: count(~to_account)
-        outgoing_count: count(~from_account)
+        incoming_count: val(inc)
+        outgoing_count: val(out)
       }
     }"""
-    variables = {'$max_bal': str(max_balance)}
-
-    print_header(f"CUENTAS FANTASMA (Saldo < ${max_balance}, Txs >= {min_txs})")
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query, variables=variables)
-        data = json.loads(res.json).get('ghost_accounts', [])
-
-        # Filtrado lógico
-        filtered = [acc for acc in data if (acc.get('incoming_count', 0) + acc.get('outgoing_count', 0)) >= min_txs]
-
-        if not filtered:
-            print("✅ Ninguna cuenta cumple con el criterio de 'Fantasma'.")
-            return
-
-        print(f"{'CUENTA':<15} | {'SALDO':<10} | {'RISK':<5} | {'ENTRADAS':<8} | {'SALIDAS':<8} | {'TOTAL FLUJO'}")
-        print_separator()
-
-        for acc in filtered:
-            total = acc['incoming_count'] + acc['outgoing_count']
-            print(f"{acc['account_id']:<15} | ${acc['balance']:<9.2f} | {acc['risk_score']:<5} | {acc['incoming_count']:<8} | {acc['outgoing_count']:<8} | {total}")
-
-    finally:
-        txn.discard()
-
-
-def query_identity_theft(client):
+    variables = {
+        '$max_bal': str(max_balance),
+        '$min_txs': str(int(min_txs)),
+        '$first': str(int(first)),
+        '$offset': str(int(offset)),
+    }
+    data = _run_query(client, query, variables).get('ghost_accounts', [])
+    return [
+        GhostAccount(
+            acc['account_id'], acc['balance'], acc.get('risk_score', 0),
+            acc.get('incoming_count', 0), acc.get('outgoing_count', 0),
+        )
+        for acc in data
+    ]
+
+
+def fetch_identity_theft(client) -> List[SharedDocument]:
     """
     Requerimiento: Suplantación de Identidad.
     """
@@ -156,29 +266,33 @@ def query_identity_theft(client):
         }
       }
     }"""
+    docs = _run_query(client, query).get('shared_documents', [])
+    return [
+        SharedDocument(
+            doc['document_id'], doc.get('doc_type', 'Unknown'),
+            [_linked_user(u) for u in doc.get('linked_users', [])],
+        )
+        for doc in docs
+    ]
 
-    print_header("SUPLANTACIÓN DE IDENTIDAD (Docs Duplicados)")
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query)
-        docs = json.loads(res.json).get('shared_documents', [])
 
-        if not docs:
-            print("✅ Integridad de documentos correcta. No hay duplicados.")
-            return
+def _path_node(node, edge=None) -> PathNode:
+    dtype = node.get('dgraph.type', [])
+    if isinstance(dtype, list): dtype = dtype[0] if dtype else "Unknown"
 
-        for doc in docs:
-            print(f"📄 DOCUMENTO COMPROMETIDO: {doc['document_id']} ({doc.get('doc_type','Unknown')})")
-            print("   ⚠️  Usuarios vinculados:")
-            for u in doc['linked_users']:
-                print(f"      - ID: {u['user_id']} | Nombre: {u['name']} | Risk: {u['risk_score']}")
-            print_separator()
+    children = []
+    for key, val in node.items():
+        if isinstance(val, list) and val and isinstance(val[0], dict):
+            # Es una relación
+            children.extend(_path_node(child, key) for child in val)
 
-    finally:
-        txn.discard()
+    return PathNode(
+        dtype, node.get('account_id'), node.get('balance'), node.get('tx_id'),
+        node.get('amount'), bool(node.get('is_flagged')), edge, children,
+    )
 
 
-def query_suspicious_path(client, start_account_id):
+def fetch_suspicious_path(client, start_account_id) -> Optional[PathNode]:
     """
     Requerimiento: Rastreo de rutas de dinero
     """
@@ -194,48 +308,11 @@ def query_suspicious_path(client, start_account_id):
         to_account
       }
     }"""
-    variables = {'$acc_id': start_account_id}
-
-    print_header(f"RASTREO DE RUTA (TRACE FLOW) - Origen: {start_account_id}")
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query, variables=variables)
-        data = json.loads(res.json).get('path_analysis', [])
-
-        if not data:
-            print("❌ Cuenta no encontrada o sin conexiones.")
-            return
-
-        def print_node(node, level=0, prefix=""):
-            indent = "    " * level
-            dtype = node.get('dgraph.type', [])
-            if isinstance(dtype, list): dtype = dtype[0] if dtype else "Unknown"
-
-            if dtype == 'Account':
-                flag = "🚩" if node.get('is_flagged') else ""
-                print(f"{indent}🏦 [{node.get('account_id')}] Saldo: ${node.get('balance',0)} {flag}")
-
-                if 'to_account' in node: # Si fuera transacción
-                    pass
+    data = _run_query(client, query, {'$acc_id': start_account_id}).get('path_analysis', [])
+    return _path_node(data[0]) if data else None
 
-            elif dtype == 'Transaction':
-                print(f"{indent}💸 TX: {node.get('tx_id')} | Monto: ${node.get('amount')} {prefix}")
-            for key, val in node.items():
-                if isinstance(val, list) and isinstance(val[0], dict):
-                    # Es una relación
-                    for child in val:
-                        arrow = "  ⬇️  " if key == 'to_account' else "  ⬆️  " # Simplificación
-                        print_node(child, level + 1, arrow)
 
-        # Imprimir raíz
-        print_node(data[0])
-        print("\n(Nota: La indentación muestra el flujo de pasos encontrados)")
-
-    finally:
-        txn.discard()
-
-
-def query_risk_scoring(client, user_id):
+def fetch_risk_context(client, user_id) -> Optional[RiskContext]:
     """
     Requerimiento: Scoring de riesgo basado en conexiones.
     """
@@ -260,55 +337,20 @@ def query_risk_scoring(client, user_id):
         }
       }
     }"""
-    variables = {'$uid': str(user_id)}
+    data = _run_query(client, query, {'$uid': str(user_id)}).get('risk_analysis', [])
+    if not data:
+        return None
 
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query, variables=variables)
-        data = json.loads(res.json).get('risk_analysis', [])
+    user = data[0]
+    devices = [
+        SharedDevice(d['device_id'], [_linked_user(o) for o in d.get('used_by_others', [])])
+        for d in user.get('uses_device', [])
+    ]
+    ips = [IpReputation(ip['ip_addr'], ip.get('ip_reputation', 0)) for ip in user.get('known_ips', [])]
+    return RiskContext(user['user_id'], user['name'], user.get('my_risk', 0), devices, ips)
 
-        if not data:
-            print("❌ Usuario no encontrado.")
-            return None
 
-        user = data[0]
-
-        print_header(f"SCORING DE RIESGO: {user['name']} (ID: {user['user_id']})")
-        print(f"🔥 RIESGO PROPIO: {user.get('my_risk', 0)}/100")
-        print_separator()
-
-        print("📱 ANÁLISIS DE DISPOSITIVOS:")
-        devices = user.get('uses_device', [])
-        if not devices: print("   (Sin dispositivos registrados)")
-
-        for d in devices:
-            others = d.get('used_by_others', [])
-            print(f"   ► Disp ID: {d['device_id']}")
-            if others:
-                print("      ⚠️  USADO TAMBIÉN POR:")
-                for o in others:
-                    print(f"         - {o['name']} (Risk: {o['risk_score']})")
-            else:
-                print("      ✅ Uso exclusivo (Limpio)")
-
-        print_separator()
-        # IPs
-        print("🌐 ANÁLISIS DE IPs:")
-        ips = user.get('known_ips', [])
-        if not ips: print("   (Sin IPs registradas)")
-
-        for ip in ips:
-            rep = ip.get('ip_reputation', 0)
-            status = "PELIGROSA ⛔" if rep > 70 else "SOSPECHOSA ⚠️" if rep > 40 else "SEGURA ✅"
-            print(f"   ► {ip['ip_addr']:<15} | Reputación: {rep:<3} | {status}")
-
-        return user
-
-    finally:
-        txn.discard()
-
-
-def query_geo_heatmap(client, lat, lon, radius_km):
+def fetch_geo_heatmap(client, lat, lon, radius_km) -> List[GeoTransaction]:
     """
     Requerimiento: Mapa de calor geográfico
     """
@@ -320,28 +362,168 @@ def query_geo_heatmap(client, lat, lon, radius_km):
         used_device { device_id }
       }
     }""" % (lon, lat)
-    variables = {'$radius': str(radius_km * 1000)}
+    txs = _run_query(client, query, {'$radius': str(radius_km * 1000)}).get('geo_transactions', [])
+    return [
+        GeoTransaction(
+            tx['tx_id'], tx['amount'],
+            tx.get('used_device', [{'device_id': 'Unknown'}])[0]['device_id'],
+            tx.get('associated_location', {}).get('coordinates', 'N/A'),
+        )
+        for tx in txs
+    ]
 
-    print_header(f"MAPA DE CALOR GEO (Radio: {radius_km}km)")
-    print(f"📍 Centro: [{lat}, {lon}]")
-    txn = client.txn(read_only=True)
-    try:
-        res = txn.query(query, variables=variables)
-        txs = json.loads(res.json).get('geo_transactions', [])
 
-        if not txs:
-            print("✅ No se encontraron transacciones en esta zona.")
-            return
+# PRESENTADORES DE CONSOLA
 
+def query_fraud_ring(client, device_id):
+    print_header(f"ANILLO DE FRAUDE (Dispositivo: {device_id})")
+    ring = fetch_fraud_ring(client, device_id)
+
+    if not ring:
+        print("✅ No se encontró el dispositivo o no tiene usuarios asociados.")
+        return ring
+
+    print(f"📍 Ubicación Disp: {ring.location}")
+    print(f"👥 Usuarios compartiendo este dispositivo: {len(ring.users)}")
+    print_separator()
+    print(f"{'USER ID':<10} | {'NOMBRE':<20} | {'RISK':<5} | {'FLAG':<5} | {'IPS CONOCIDAS'}")
+    print_separator()
+
+    for u in ring.users:
+        flag = "🚩" if u.is_flagged else "OK"
+        print(f"{u.user_id:<10} | {u.name:<20} | {u.risk_score:<5} | {flag:<5} | {', '.join(u.ips)}")
+    return ring
+
+
+def query_money_laundering_pattern(client, min_amount, since=None, until=None,
+                                   first=LAUNDERING_PAGE_SIZE, offset=0):
+    print_header(f"POSIBLE LAVADO (Montos >= ${min_amount})")
+    txs = fetch_money_laundering_pattern(client, min_amount, since, until, first, offset)
+
+    if not txs:
+        print("✅ No se detectaron transacciones sospechosas por ese monto.")
+        return txs
+
+    print(f"{'FECHA':<12} | {'TX ID':<10} | {'MONTO ($)':<12} | {'ORIGEN (Cuenta/Dueño)':<30} | {'DESTINO (Cuenta/Dueño)'}")
+    print_separator()
+
+    for tx in txs:
+        src_str = f"{tx.source_account} ({tx.source_owner})"
+        tgt_str = f"{tx.target_account} ({tx.target_owner})"
+        print(f"{tx.tx_ts[:10]:<12} | {tx.tx_id:<10} | ${tx.amount:<11.2f} | {src_str[:29]:<30} | {tgt_str}")
+    return txs
+
+
+def query_ghost_accounts(client, max_balance, min_txs, first=GHOST_PAGE_SIZE, offset=0):
+    print_header(f"CUENTAS FANTASMA (Saldo < ${max_balance}, Txs >= {min_txs})")
+    accounts = fetch_ghost_accounts(client, max_balance, min_txs, first, offset)
+
+    if not accounts:
+        print("✅ Ninguna cuenta cumple con el criterio de 'Fantasma'.")
+        return accounts
+
+    print(f"{'CUENTA':<15} | {'SALDO':<10} | {'RISK':<5} | {'ENTRADAS':<8} | {'SALIDAS':<8} | {'TOTAL FLUJO'}")
+    print_separator()
+
+    for acc in accounts:
+        print(f"{acc.account_id:<15} | ${acc.balance:<9.2f} | {acc.risk_score:<5} | {acc.incoming_count:<8} | {acc.outgoing_count:<8} | {acc.total}")
+    return accounts
+
+
+def query_identity_theft(client):
+    print_header("SUPLANTACIÓN DE IDENTIDAD (Docs Duplicados)")
+    docs = fetch_identity_theft(client)
+
+    if not docs:
+        print("✅ Integridad de documentos correcta. No hay duplicados.")
+        return docs
+
+    for doc in docs:
+        print(f"📄 DOCUMENTO COMPROMETIDO: {doc.document_id} ({doc.doc_type})")
+        print("   ⚠️  Usuarios vinculados:")
+        for u in doc.users:
+            print(f"      - ID: {u.user_id} | Nombre: {u.name} | Risk: {u.risk_score}")
         print_separator()
-        print(f"🔍 Se encontraron {len(txs)} transacciones:")
-        print_separator()
-        print(f"{'TX ID':<10} | {'MONTO':<10} | {'DISPOSITIVO':<20} | {'COORDENADAS'}")
+    return docs
 
-        for tx in txs:
-            dev = tx.get('used_device', [{'device_id': 'Unknown'}])[0]['device_id']
-            coords = tx.get('associated_location', {}).get('coordinates', 'N/A')
-            print(f"{tx['tx_id']:<10} | ${tx['amount']:<9.2f} | {dev:<20} | {coords}")
 
-    finally:
-        txn.discard()
+def _print_path_node(node, level=0):
+    indent = "    " * level
+    if node.node_type == 'Account':
+        flag = "🚩" if node.is_flagged else ""
+        print(f"{indent}🏦 [{node.account_id}] Saldo: ${0 if node.balance is None else node.balance} {flag}")
+    elif node.node_type == 'Transaction':
+        prefix = ""
+        if node.edge is not None:
+            prefix = "  ⬇️  " if node.edge == 'to_account' else "  ⬆️  " # Simplificación
+        print(f"{indent}💸 TX: {node.tx_id} | Monto: ${node.amount} {prefix}")
+    for child in node.children:
+        _print_path_node(child, level + 1)
+
+
+def query_suspicious_path(client, start_account_id):
+    print_header(f"RASTREO DE RUTA (TRACE FLOW) - Origen: {start_account_id}")
+    root = fetch_suspicious_path(client, start_account_id)
+
+    if not root:
+        print("❌ Cuenta no encontrada o sin conexiones.")
+        return root
+
+    # Imprimir raíz
+    _print_path_node(root)
+    print("\n(Nota: La indentación muestra el flujo de pasos encontrados)")
+    return root
+
+
+def query_risk_scoring(client, user_id):
+    ctx = fetch_risk_context(client, user_id)
+    if not ctx:
+        print("❌ Usuario no encontrado.")
+        return None
+
+    print_header(f"SCORING DE RIESGO: {ctx.name} (ID: {ctx.user_id})")
+    print(f"🔥 RIESGO PROPIO: {ctx.risk_score}/100")
+    print_separator()
+
+    print("📱 ANÁLISIS DE DISPOSITIVOS:")
+    if not ctx.devices: print("   (Sin dispositivos registrados)")
+
+    for d in ctx.devices:
+        print(f"   ► Disp ID: {d.device_id}")
+        if d.used_by_others:
+            print("      ⚠️  USADO TAMBIÉN POR:")
+            for o in d.used_by_others:
+                print(f"         - {o.name} (Risk: {o.risk_score})")
+        else:
+            print("      ✅ Uso exclusivo (Limpio)")
+
+    print_separator()
+    # IPs
+    print("🌐 ANÁLISIS DE IPs:")
+    if not ctx.ips: print("   (Sin IPs registradas)")
+
+    for ip in ctx.ips:
+        rep = ip.reputation
+        status = "PELIGROSA ⛔" if rep > 70 else "SOSPECHOSA ⚠️" if rep > 40 else "SEGURA ✅"
+        print(f"   ► {ip.ip_addr:<15} | Reputación: {rep:<3} | {status}")
+
+    return ctx
+
+
+def query_geo_heatmap(client, lat, lon, radius_km):
+    print_header(f"MAPA DE CALOR GEO (Radio: {radius_km}km)")
+    print(f"📍 Centro: [{lat}, {lon}]")
+    txs = fetch_geo_heatmap(client, lat, lon, radius_km)
+
+    if not txs:
+        print("✅ No se encontraron transacciones en esta zona.")
+        return txs
+
+    print_separator()
+    print(f"🔍 Se encontraron {len(txs)} transacciones:")
+    print_separator()
+    print(f"{'TX ID':<10} | {'MONTO':<10} | {'DISPOSITIVO':<20} | {'COORDENADAS'}")
+
+    for tx in txs:
+        print(f"{tx.tx_id:<10} | ${tx.amount:<9.2f} | {tx.device_id:<20} | {tx.coordinates}")
+    return txs
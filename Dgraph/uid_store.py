@@ -0,0 +1,84 @@
+import os
+import sqlite3
+
+from connect import DGRAPH_URI
+
+# Archivo local con el mapa persistente xid -> uid (junto a los CSV de Dgraph)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.getenv(
+    "DGRAPH_UID_STORE",
+    os.path.join(BASE_DIR, '..', 'data', 'dgraph', 'uid_map.sqlite3')
+)
+
+
+class UidStore:
+    """
+    Mapa persistente {tipo de nodo: {xid: uid}} guardado en SQLite.
+    Permite cargar aristas en otro proceso y reanudar cargas parciales
+    sin volver a crear nodos que ya existen en Dgraph.
+
+    Los uid solo valen en el cluster que los asignó, así que cada fila lleva
+    el 'target' (DGRAPH_URI): apuntar a otro Dgraph usa un mapa vacío.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, target=DGRAPH_URI):
+        self.path = path
+        self.target = target
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS uids (
+                target TEXT NOT NULL,
+                node_type TEXT NOT NULL,
+                xid TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                PRIMARY KEY (target, node_type, xid)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def get_map(self, node_type):
+        """Devuelve {xid: uid} de un tipo de nodo"""
+        cur = self.conn.execute(
+            "SELECT xid, uid FROM uids WHERE target = ? AND node_type = ?", (self.target, node_type)
+        )
+        return dict(cur)
+
+    def get(self, node_type, xid):
+        row = self.conn.execute(
+            "SELECT uid FROM uids WHERE target = ? AND node_type = ? AND xid = ?",
+            (self.target, node_type, xid)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, node_type, mapping):
+        """Guarda (o reemplaza) pares xid -> uid; se llama después de cada chunk confirmado"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO uids (target, node_type, xid, uid) VALUES (?, ?, ?, ?)",
+                ((self.target, node_type, xid, uid) for xid, uid in mapping.items())
+            )
+
+    def count(self, node_type=None):
+        if node_type is None:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM uids WHERE target = ?", (self.target,)
+            ).fetchone()[0]
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM uids WHERE target = ? AND node_type = ?", (self.target, node_type)
+        ).fetchone()[0]
+
+    def clear(self):
+        """Vacía el mapa de este cluster (p. ej. después de un drop_all en Dgraph)"""
+        with self.conn:
+            self.conn.execute("DELETE FROM uids WHERE target = ?", (self.target,))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
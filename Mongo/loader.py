@@ -1,7 +1,15 @@
 import json
 import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pymongo import ASCENDING, DESCENDING
+from functools import partial
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from cache import invalidate_store
 
 # Fechas
 def parse_mongo_date(value):
@@ -22,132 +30,399 @@ def parse_mongo_date(value):
             return None
 
 
-#Cargar usuarios
-def _load_users(db, filepath):
-    collection = db["users"]
-    
-    if not os.path.exists(filepath):
-        print(f" Archivo no encontrado: {filepath}")
-        return
+# Nombres normalizados para búsqueda ("Lucía" -> "lucia")
+_NON_WORD = re.compile(r"[^\w\s]+")
+NGRAM_SIZE = 3
 
-    with open(filepath, 'r', encoding='utf-8') as f:
-        users_data = json.load(f)
-    
-    processed_docs = []
-    for doc in users_data:
-        if "user_id" in doc and doc["user_id"] is not None:
-            try:
-                doc["user_id"] = int(doc["user_id"])
-            except ValueError:
-                pass
-        if "fecha_nacimiento" in doc:
-            doc["fecha_nacimiento"] = parse_mongo_date(doc["fecha_nacimiento"])
-        if "fecha_creacion" in doc:
-            doc["fecha_creacion"] = parse_mongo_date(doc["fecha_creacion"])
-            
-        if "logins" in doc and isinstance(doc["logins"], list):
-            for login in doc["logins"]:
-                if "ts" in login: 
-                    login["ts"] = parse_mongo_date(login["ts"])
-                elif "timestamp" in login:
-                    login["timestamp"] = parse_mongo_date(login["timestamp"])
-                    
-        processed_docs.append(doc)
-
-    if processed_docs:
-        collection.insert_many(processed_docs)
-        #print(f"Insertados {len(processed_docs)} documentos en 'users'.")
-    
-    collection.create_index([("user_id", ASCENDING)], unique=True)
-    collection.create_index([("email", ASCENDING)], unique=True)
-    collection.create_index([("logins.ip", ASCENDING)])
-    #print("   Índices de 'users' creados.")
 
-def _load_accounts(db, filepath):
-    collection = db["accounts"]
-    
-    if not os.path.exists(filepath):
-        print(f"⚠️ Archivo no encontrado: {filepath}")
-        return
+def normalize_name(value):
+    """Minúsculas, sin acentos ni signos, espacios colapsados"""
+    if not value:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def name_ngrams(text, n=NGRAM_SIZE):
+    """Trigramas de cada palabra (con bordes) para búsquedas aproximadas"""
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+    return sorted(grams)
+
+
+def name_fields(first_name, last_name, ngrams=False):
+    """
+    Campos de búsqueda de un usuario:
+    - name_tokens: palabras normalizadas de nombre y apellidos (índice multikey,
+      se consultan con prefijo anclado '^...', que sí usa el índice)
+    - name_ngrams: trigramas opcionales para coincidencias aproximadas
+    """
+    full = normalize_name(f"{first_name or ''} {last_name or ''}")
+    fields = {"name_tokens": full.split()}
+    if ngrams:
+        fields["name_ngrams"] = name_ngrams(full)
+    return fields
+
+
+# Parámetros del loader por streaming
+DEFAULT_CHUNK_SIZE = 1000        # documentos por insert_many
+READ_BLOCK_SIZE = 1 << 16        # bytes leídos del archivo por iteración
+MAX_DOCUMENT_CHARS = 16 << 20    # un documento más grande que el límite BSON es un error
+
+
+def iter_json_documents(filepath, block_size=READ_BLOCK_SIZE, max_document_chars=MAX_DOCUMENT_CHARS):
+    """
+    Itera los documentos de un archivo JSON sin cargarlo completo en memoria.
+    Soporta un arreglo JSON ([{...}, {...}]) o NDJSON (un documento por línea).
+    Si un documento no se puede decodificar con 'max_document_chars' caracteres
+    pendientes, se considera mal formado y se lanza el error sin leer el resto.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    offset = 0      # caracteres ya descartados del buffer (para ubicar errores)
+    eof = False
 
     with open(filepath, 'r', encoding='utf-8') as f:
-        accounts_data = json.load(f)
-        
-    processed_docs = []
-    for doc in accounts_data:
-        if "fecha_creacion" in doc:
-            doc["fecha_creacion"] = parse_mongo_date(doc["fecha_creacion"])
-        if "fecha_actualizacion" in doc:
-            doc["fecha_actualizacion"] = parse_mongo_date(doc["fecha_actualizacion"])
-        if "flagged_at" in doc:
-            doc["flagged_at"] = parse_mongo_date(doc["flagged_at"])
-            
-        if "status_history" in doc and isinstance(doc["status_history"], list):
-            for status in doc["status_history"]:
-                if "changed_at" in status:
-                    status["changed_at"] = parse_mongo_date(status["changed_at"])
-        
-        if "saldo_actual" in doc:
-            doc["saldo_actual"] = float(doc["saldo_actual"])
-
-        processed_docs.append(doc)
-
-    if processed_docs:
-        collection.insert_many(processed_docs)
-        #print(f" Insertados {len(processed_docs)} documentos en 'accounts'.")
-
-  
-    collection.create_index([("account_id", ASCENDING)], unique=True)
-    collection.create_index([("user_id", ASCENDING)])
-    collection.create_index([("numero_cuenta", ASCENDING)], unique=True)
-    #print("   Índices de 'accounts' creados.")
-
-def _load_transactions(db, filepath):
-    collection = db["transactions_meta"] 
-    
+        while True:
+            # Saltar separadores entre documentos: espacios, '[' inicial y comas
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] in "[,"):
+                pos += 1
+
+            if pos < len(buf) and buf[pos] == "]":
+                return
+
+            if pos < len(buf):
+                try:
+                    doc, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if eof:
+                        raise
+                    if len(buf) - pos > max_document_chars:
+                        raise ValueError(
+                            f"{os.path.basename(filepath)}: documento mal formado cerca del "
+                            f"carácter {offset + e.pos} ({e.msg})"
+                        ) from e
+                else:
+                    pos = end
+                    yield doc
+                    continue
+
+            if eof:
+                return
+
+            # Documento incompleto: compactar el buffer y leer el siguiente bloque
+            chunk = f.read(block_size)
+            eof = not chunk
+            offset += pos
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def _convert_user(doc, ngrams=False):
+    doc.update(name_fields(doc.get("first_name"), doc.get("last_name"), ngrams))
+    if "user_id" in doc and doc["user_id"] is not None:
+        try:
+            doc["user_id"] = int(doc["user_id"])
+        except ValueError:
+            pass
+    if "fecha_nacimiento" in doc:
+        doc["fecha_nacimiento"] = parse_mongo_date(doc["fecha_nacimiento"])
+    if "fecha_creacion" in doc:
+        doc["fecha_creacion"] = parse_mongo_date(doc["fecha_creacion"])
+
+    if "logins" in doc and isinstance(doc["logins"], list):
+        for login in doc["logins"]:
+            if "ts" in login:
+                login["ts"] = parse_mongo_date(login["ts"])
+            elif "timestamp" in login:
+                login["timestamp"] = parse_mongo_date(login["timestamp"])
+    return doc
+
+
+def _convert_account(doc):
+    if "fecha_creacion" in doc:
+        doc["fecha_creacion"] = parse_mongo_date(doc["fecha_creacion"])
+    if "fecha_actualizacion" in doc:
+        doc["fecha_actualizacion"] = parse_mongo_date(doc["fecha_actualizacion"])
+    if "flagged_at" in doc:
+        doc["flagged_at"] = parse_mongo_date(doc["flagged_at"])
+
+    if "status_history" in doc and isinstance(doc["status_history"], list):
+        for status in doc["status_history"]:
+            if "changed_at" in status:
+                status["changed_at"] = parse_mongo_date(status["changed_at"])
+
+    if "saldo_actual" in doc:
+        doc["saldo_actual"] = float(doc["saldo_actual"])
+    return doc
+
+
+def _convert_transaction(doc):
+    if "user_id" in doc:
+        try:
+            doc["user_id"] = int(doc["user_id"])
+        except ValueError: pass
+    if "transaction_id" in doc:
+        try:
+            doc["transaction_id"] = int(doc["transaction_id"])
+        except ValueError: pass
+    if "timestamp" in doc:
+        doc["timestamp"] = parse_mongo_date(doc["timestamp"])
+
+    if "amount_details" in doc and "total" in doc["amount_details"]:
+        doc["amount_details"]["total"] = float(doc["amount_details"]["total"])
+    return doc
+
+
+def _insert_chunk(collection, docs):
+    """insert_many desordenado; devuelve los documentos que quedaron insertados."""
+    try:
+        collection.insert_many(docs, ordered=False)
+        return docs
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        print(f"   ⚠️ {len(errors)} documento(s) rechazados en '{collection.name}'.")
+        rejected = {err["index"] for err in errors}
+        return [doc for i, doc in enumerate(docs) if i not in rejected]
+
+
+def load_collection(db, name, filepath, convert, chunk_size=DEFAULT_CHUNK_SIZE, after_insert=None):
+    """
+    Carga un archivo JSON/NDJSON en la colección 'name' por streaming.
+    Cada documento se convierte con 'convert' y se inserta en bloques de
+    'chunk_size' con insert_many(ordered=False); en memoria solo vive un bloque.
+    'after_insert(db, insertados)' se llama tras cada bloque solo con los
+    documentos que sí se insertaron (rollups).
+    """
+    collection = db[name]
+
     if not os.path.exists(filepath):
-        print(f"Archivo no encontrado: {filepath}")
-        return
+        print(f" Archivo no encontrado: {filepath}")
+        return None
 
-    with open(filepath, 'r', encoding='utf-8') as f:
-        tx_data = json.load(f)
-        
-    processed_docs = []
-    for doc in tx_data:
-        if "user_id" in doc:
-            try:
-                doc["user_id"] = int(doc["user_id"])
-            except ValueError: pass
-        if "transaction_id" in doc:
-            try:
-                doc["transaction_id"] = int(doc["transaction_id"])
-            except ValueError: pass
-        if "timestamp" in doc:
-            doc["timestamp"] = parse_mongo_date(doc["timestamp"])
-            
-        if "amount_details" in doc and "total" in doc["amount_details"]:
-            doc["amount_details"]["total"] = float(doc["amount_details"]["total"])
-            
-        processed_docs.append(doc)
-        
-    if processed_docs:
-        collection.insert_many(processed_docs)
-        #print(f"Insertados {len(processed_docs)} documentos en 'transactions_meta'.")
-    
+    start = time.perf_counter()
+    inserted = 0
+    chunk = []
+
+    for doc in iter_json_documents(filepath):
+        chunk.append(convert(doc))
+        if len(chunk) >= chunk_size:
+            done = _insert_chunk(collection, chunk)
+            inserted += len(done)
+            if after_insert and done:
+                after_insert(db, done)
+            chunk = []
+
+    if chunk:
+        done = _insert_chunk(collection, chunk)
+        inserted += len(done)
+        if after_insert and done:
+            after_insert(db, done)
+
+    elapsed = time.perf_counter() - start
+    rate = inserted / elapsed if elapsed > 0 else 0.0
+    print(f"   ✅ {name}: {inserted} documentos en {elapsed:.2f}s ({rate:,.0f} docs/s)")
+    return {"collection": name, "docs": inserted, "elapsed": elapsed, "docs_per_s": rate}
+
+
+#Cargar usuarios
+def _load_users(db, filepath, chunk_size=DEFAULT_CHUNK_SIZE, ngrams=False):
+    return load_collection(db, "users", filepath, partial(_convert_user, ngrams=ngrams), chunk_size)
+
+def _load_accounts(db, filepath, chunk_size=DEFAULT_CHUNK_SIZE):
+    return load_collection(db, "accounts", filepath, _convert_account, chunk_size)
+
+def _load_transactions(db, filepath, chunk_size=DEFAULT_CHUNK_SIZE):
+    return load_collection(db, "transactions_meta", filepath, _convert_transaction, chunk_size,
+                           after_insert=update_ip_usage)
+
+
+# Rollup de IPs compartidas: un documento por IP en 'ip_usage' con los
+# usuarios y ubicaciones vistos (acotados), total de operaciones y primera /
+# última vez. detect_suspicious_ip_changes lo lee en lugar de agrupar todo
+# transactions_meta. Cualquier ingesta de transacciones debe llamar a
+# update_ip_usage con los documentos insertados.
+IP_USAGE_COLLECTION = "ip_usage"
+IP_USERS_CAP = 100          # user_count se satura en este valor
+IP_LOCATIONS_CAP = 20
+
+
+def _capped_union(field, values, cap):
+    """$addToSet acotado: unión con los valores nuevos, recortada a 'cap'"""
+    # $literal: un valor que empiece con '$' no debe leerse como campo
+    return {"$slice": [{"$setUnion": [{"$ifNull": [f"${field}", []]}, {"$literal": values}]}, cap]}
 
-    collection.create_index([("transaction_id", ASCENDING)], unique=True)
-    collection.create_index([("timestamp", DESCENDING)]) 
-    collection.create_index([("flow.account_origen", ASCENDING)])
-    collection.create_index([("flow.account_destino", ASCENDING)])
-    collection.create_index([("digital_fingerprint.ip", ASCENDING)])
-    collection.create_index([("digital_fingerprint.device_model", ASCENDING)])
-    collection.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING)])
 
-    #print("   Índices de 'transactions_meta' creados.")
+def update_ip_usage(db, transactions):
+    """
+    Agrega en memoria un bloque de transacciones por IP y aplica un upsert por
+    IP (equivalente a $addToSet/$inc/$min/$max, como update con pipeline para
+    poder acotar los arreglos). Devuelve cuántas IPs se actualizaron.
+    """
+    by_ip = {}
+    for tx in transactions:
+        fp = tx.get("digital_fingerprint") or {}
+        ip = fp.get("ip")
+        if not ip:
+            continue
+        agg = by_ip.setdefault(ip, {"users": set(), "locations": set(), "txs": 0, "first": None, "last": None})
+        agg["txs"] += 1
+        if tx.get("user_id") is not None:
+            agg["users"].add(tx["user_id"])
+        if fp.get("location_approx"):
+            agg["locations"].add(fp["location_approx"])
+        ts = tx.get("timestamp")
+        if isinstance(ts, datetime):
+            agg["first"] = ts if agg["first"] is None else min(agg["first"], ts)
+            agg["last"] = ts if agg["last"] is None else max(agg["last"], ts)
+
+    ops = []
+    for ip, agg in by_ip.items():
+        ops.append(UpdateOne({"_id": ip}, [
+            {"$set": {
+                "users": _capped_union("users", sorted(agg["users"], key=str), IP_USERS_CAP),
+                "locations": _capped_union("locations", sorted(agg["locations"]), IP_LOCATIONS_CAP),
+                "tx_count": {"$add": [{"$ifNull": ["$tx_count", 0]}, agg["txs"]]},
+                # $min/$max ignoran null, así que sirven también para el primer upsert
+                "first_seen": {"$min": ["$first_seen", agg["first"]]},
+                "last_seen": {"$max": ["$last_seen", agg["last"]]},
+            }},
+            {"$set": {"user_count": {"$size": "$users"}}},
+        ], upsert=True))
+    if ops:
+        db[IP_USAGE_COLLECTION].bulk_write(ops, ordered=False)
+        invalidate_store(IP_USAGE_COLLECTION)
+    return len(ops)
+
+
+def rebuild_ip_usage(db):
+    """Reconstruye ip_usage desde transactions_meta (una sola pasada en el servidor)"""
+    start = time.perf_counter()
+    db[IP_USAGE_COLLECTION].drop()
+    db.transactions_meta.aggregate([
+        {"$match": {"digital_fingerprint.ip": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": "$digital_fingerprint.ip",
+            "users": {"$addToSet": "$user_id"},
+            "locations": {"$addToSet": "$digital_fingerprint.location_approx"},
+            "tx_count": {"$sum": 1},
+            "first_seen": {"$min": "$timestamp"},
+            "last_seen": {"$max": "$timestamp"},
+        }},
+        {"$set": {
+            "users": {"$slice": ["$users", IP_USERS_CAP]},
+            "locations": {"$slice": ["$locations", IP_LOCATIONS_CAP]},
+        }},
+        {"$set": {"user_count": {"$size": "$users"}}},
+        {"$merge": {"into": IP_USAGE_COLLECTION, "whenMatched": "replace"}},
+    ], allowDiskUse=True)
+    invalidate_store(IP_USAGE_COLLECTION)
+    total = db[IP_USAGE_COLLECTION].count_documents({})
+    print(f"   🌐 {IP_USAGE_COLLECTION}: {total} IPs en {time.perf_counter() - start:.2f}s")
+    return total
+
+
+# Índices por colección (se construyen DESPUÉS de la carga masiva)
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("logins.ip", ASCENDING)]),
+        IndexModel([("name_tokens", ASCENDING)]),
+        IndexModel([("name_ngrams", ASCENDING)], sparse=True),
+    ],
+    "accounts": [
+        IndexModel([("account_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+        IndexModel([("numero_cuenta", ASCENDING)], unique=True),
+        IndexModel([("fecha_creacion", DESCENDING)]),
+    ],
+    "transactions_meta": [
+        IndexModel([("transaction_id", ASCENDING)], unique=True),
+        IndexModel([("timestamp", DESCENDING)]),
+        # Compuestos (cuenta, monto): sirven a las búsquedas por cuenta y a
+        # get_high_risk_new_accounts, que además filtra por monto mínimo
+        IndexModel([("flow.account_origen", ASCENDING), ("amount_details.total", DESCENDING)]),
+        IndexModel([("flow.account_destino", ASCENDING), ("amount_details.total", DESCENDING)]),
+        IndexModel([("digital_fingerprint.ip", ASCENDING)]),
+        IndexModel([("digital_fingerprint.device_model", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    # Rollup por IP; detect_suspicious_ip_changes filtra por user_count > 1
+    IP_USAGE_COLLECTION: [
+        IndexModel([("user_count", ASCENDING), ("last_seen", DESCENDING)]),
+    ],
+    # Scores materializados por Mongo/risk_worker.py
+    "risk_scores": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("risk_score", DESCENDING)]),
+    ],
+}
+
+
+def _build_collection_indexes(db, name):
+    """Un solo create_indexes por colección: el servidor recorre los datos una vez."""
+    start = time.perf_counter()
+    names = db[name].create_indexes(INDEXES[name])
+    elapsed = time.perf_counter() - start
+    print(f"   🗂️ {name}: {len(names)} índices en {elapsed:.2f}s")
+    for index_name in names:
+        print(f"      - {index_name}")
+    return {"collection": name, "indexes": names, "elapsed": elapsed}
+
+
+def build_indexes(db, collections=None):
+    """
+    Construye los índices de INDEXES una vez que los datos están insertados.
+    Cada colección se construye en paralelo en su propio hilo.
+    """
+    collections = list(collections or INDEXES)
+    print(f"🗂️ Construyendo índices de: {', '.join(collections)}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(collections)) as pool:
+        futures = [pool.submit(_build_collection_indexes, db, name) for name in collections]
+        results = [fut.result() for fut in futures]
+
+    print(f"   Índices listos en {time.perf_counter() - start:.2f}s")
+    return results
 
 
 # Funcion principal
-def populate_database(db, data_dir="data/mongo"):
+def backfill_name_fields(db, chunk_size=DEFAULT_CHUNK_SIZE, ngrams=False):
+    """Calcula name_tokens/name_ngrams en una base ya cargada (sin recargar los JSON)"""
+    start = time.perf_counter()
+    ops = []
+    updated = 0
+    cursor = db.users.find({}, {"first_name": 1, "last_name": 1}, batch_size=chunk_size)
+    for doc in cursor:
+        fields = name_fields(doc.get("first_name"), doc.get("last_name"), ngrams)
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(ops) >= chunk_size:
+            updated += db.users.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.users.bulk_write(ops, ordered=False).modified_count
+    print(f"   🔤 users: {updated} nombres normalizados en {time.perf_counter() - start:.2f}s")
+    return updated
+
+
+def populate_database(db, data_dir="data/mongo", chunk_size=DEFAULT_CHUNK_SIZE, skip_indexes=False, indexes_only=False,
+                      name_ngrams=False):
+    """
+    Pobla MongoDB: limpia, carga por streaming y al final construye índices.
+    - skip_indexes: solo carga los datos
+    - indexes_only: no toca los datos, solo (re)construye los índices
+    - name_ngrams: guarda también trigramas del nombre (búsqueda aproximada)
+    """
+    if indexes_only:
+        build_indexes(db)
+        return
+
     print(f"📂 Buscando archivos en: {data_dir}")
     
     # Limpiamos
@@ -155,10 +430,57 @@ def populate_database(db, data_dir="data/mongo"):
     db.users.drop()
     db.accounts.drop()
     db.transactions_meta.drop()
+    db[IP_USAGE_COLLECTION].drop()
+    # Scores materializados de los datos anteriores y checkpoint del worker:
+    # get_risk_score vuelve a calcular en vivo y el worker hará backfill al reiniciar
+    db.risk_scores.drop()
+    db.worker_state.delete_one({"_id": "risk_scores"})
     
     # Carga
-    _load_users(db, os.path.join(data_dir, "users.json"))
-    _load_accounts(db, os.path.join(data_dir, "accounts.json"))
-    _load_transactions(db, os.path.join(data_dir, "transactions_meta.json"))
+    _load_users(db, os.path.join(data_dir, "users.json"), chunk_size, ngrams=name_ngrams)
+    _load_accounts(db, os.path.join(data_dir, "accounts.json"), chunk_size)
+    _load_transactions(db, os.path.join(data_dir, "transactions_meta.json"), chunk_size)
+
+    # Índices
+    if not skip_indexes:
+        build_indexes(db)
     
-    print("\n✨ Población de MongoDB finalizada.")
\ No newline at end of file
+    print("\n✨ Población de MongoDB finalizada.")
+
+
+if __name__ == "__main__":
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Población de MongoDB (ITESO BANK)")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="fraude_financiero")
+    parser.add_argument("--data-dir", default="data/mongo")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--skip-indexes", action="store_true", help="Cargar datos sin construir índices")
+    group.add_argument("--indexes-only", action="store_true", help="Solo reconstruir índices")
+    group.add_argument("--backfill-names", action="store_true", help="Solo calcular los campos de búsqueda por nombre")
+    group.add_argument("--rebuild-ip-usage", action="store_true", help="Solo reconstruir el rollup ip_usage")
+    parser.add_argument("--name-ngrams", action="store_true", help="Guardar trigramas para búsqueda aproximada")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    try:
+        if args.backfill_names:
+            backfill_name_fields(client[args.db], args.chunk_size, ngrams=args.name_ngrams)
+            build_indexes(client[args.db], ["users"])
+        elif args.rebuild_ip_usage:
+            rebuild_ip_usage(client[args.db])
+            build_indexes(client[args.db], [IP_USAGE_COLLECTION])
+        else:
+            populate_database(
+                client[args.db],
+                args.data_dir,
+                chunk_size=args.chunk_size,
+                skip_indexes=args.skip_indexes,
+                indexes_only=args.indexes_only,
+                name_ngrams=args.name_ngrams,
+            )
+    finally:
+        client.close()
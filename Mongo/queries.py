@@ -1,5 +1,10 @@
-from pymongo import DESCENDING
+import re
+import time
+import numpy as np
+from pymongo import DESCENDING, ReplaceOne
 from datetime import datetime, timedelta
+from cache import invalidate_store
+from .loader import IP_USAGE_COLLECTION, name_ngrams, normalize_name
 
 # Req 5. Vistas de usuario
 def get_user_financial_view(db, user_id):
@@ -157,32 +162,94 @@ def get_user_devices(db, user_id):
 
 
 #Req 9: Busqueda flexible de cuentas
-def find_users_by_name(db, name_input):
-    regex_pattern = {"$regex": name_input, "$options": "i"}
-    
+_USER_SEARCH_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "nombre_completo": {"$concat": ["$first_name", " ", "$last_name"]},
+    "email": 1
+}
+
+
+
+def find_users_by_name(db, name_input, limit=5):
+    """
+    Búsqueda por prefijo sobre name_tokens (normalizados en la carga): cada
+    palabra del texto debe ser prefijo de alguna palabra del nombre, así
+    "luc gar" encuentra a "Lucía García". Las regex quedan ancladas ('^') y
+    escapadas, por lo que usan el índice en lugar de recorrer 'users'.
+    Si no hay coincidencias y existen trigramas, cae a búsqueda aproximada.
+    """
+    tokens = normalize_name(name_input).split()
+    if not tokens:
+        return []
+
+    prefixes = [{"$regex": "^" + re.escape(tok)} for tok in tokens]
+    match = {"name_tokens": prefixes[0]} if len(prefixes) == 1 else \
+        {"$and": [{"name_tokens": p} for p in prefixes]}
+
     pipeline = [
-        {
-            "$match": {
-                "$or": [
-                    {"first_name": regex_pattern},
-                    {"last_name": regex_pattern}
-                ]
-            }
-        },
-        {
-            "$project": {
-                "_id": 0,
-                "user_id": 1,
-                "nombre_completo": {"$concat": ["$first_name", " ", "$last_name"]},
-                "email": 1
-            }
-        },
-        {"$limit": 5} 
+        {"$match": match},
+        {"$limit": limit},
+        {"$project": _USER_SEARCH_PROJECTION},
+    ]
+    result = list(db.users.aggregate(pipeline))
+    return result or _find_users_by_ngrams(db, " ".join(tokens), limit)
+
+
+def _find_users_by_ngrams(db, normalized, limit):
+    """
+    Coincidencia aproximada: usuarios que comparten más trigramas con el texto.
+    Se exige al menos 'min_shared' trigramas, así que a un candidato le faltan
+    como máximo len(grams) - min_shared; cualquier subconjunto de
+    len(grams) - min_shared + 1 trigramas contiene alguno suyo. El $match
+    inicial usa ese subconjunto (primero los trigramas interiores, menos
+    comunes que los de borde) y todos los candidatos se ordenan antes del $limit.
+    """
+    grams = name_ngrams(normalized)
+    min_shared = max(1, len(grams) // 2)
+    selective = sorted(grams, key=lambda g: " " in g)[:len(grams) - min_shared + 1]
+    pipeline = [
+        {"$match": {"name_ngrams": {"$in": selective}}},
+        {"$addFields": {"_shared": {"$size": {"$setIntersection": ["$name_ngrams", grams]}}}},
+        {"$match": {"_shared": {"$gte": min_shared}}},
+        {"$sort": {"_shared": -1, "user_id": 1}},
+        {"$limit": limit},
+        {"$project": _USER_SEARCH_PROJECTION},
     ]
-    
     return list(db.users.aggregate(pipeline))
 
 # Req 10: Cuentas Nuevas de Alto Riesgo
+# Campos de las transacciones grandes que se anexan a cada cuenta
+_LARGE_TX_PROJECTION = {
+    "_id": 0,
+    "tx_id": "$transaction_id",
+    "monto": "$amount_details.total",
+    "destino": "$flow.account_destino",
+    "fecha": "$timestamp",
+}
+
+
+def _large_tx_lookup(side, amount_threshold, as_field):
+    """
+    $lookup por igualdad sobre flow.<side> con el filtro de monto como
+    predicado normal (no $expr): el servidor lo resuelve con un IXSCAN sobre
+    el índice compuesto (flow.<side>, amount_details.total), acotando ambas
+    llaves, en lugar de recorrer transactions_meta por cada cuenta.
+    """
+    return {
+        "$lookup": {
+            "from": "transactions_meta",
+            "localField": "account_id",
+            "foreignField": f"flow.{side}",
+            "pipeline": [
+                {"$match": {"amount_details.total": {"$gte": amount_threshold}}},
+                {"$project": _LARGE_TX_PROJECTION},
+            ],
+            "as": as_field,
+        }
+    }
+
+
 def get_high_risk_new_accounts(db, days_threshold=365, amount_threshold=1000):
     date_limit = datetime.utcnow() - timedelta(days=days_threshold)
     
@@ -190,38 +257,14 @@ def get_high_risk_new_accounts(db, days_threshold=365, amount_threshold=1000):
         # Filtrar cuentas nuevas(tiempo threshold)
         {"$match": {"fecha_creacion": {"$gte": date_limit}}},
         
-        # Buscar transacciones grandes asociadas
-        {
-            "$lookup": {
-                "from": "transactions_meta",
-                "let": {"acc_id": "$account_id"},
-                "pipeline": [
-                    {
-                        "$match": {
-                            "$expr": {
-                                "$and": [
-                                    {"$or": [
-                                        {"$eq": ["$flow.account_origen", "$$acc_id"]},
-                                        {"$eq": ["$flow.account_destino", "$$acc_id"]}
-                                    ]},
-                                    {"$gte": ["$amount_details.total", amount_threshold]}
-                                ]
-                            }
-                        }
-                    },
-                    { 
-                        "$project": { 
-                            "_id": 0, 
-                            "tx_id": "$transaction_id", 
-                            "monto": "$amount_details.total", 
-                            "destino": "$flow.account_destino",
-                            "fecha": "$timestamp"
-                        } 
-                    }
-                ],
-                "as": "transacciones_sospechosas"
-            }
-        },
+        # Buscar transacciones grandes asociadas: una búsqueda indexada por
+        # cuenta origen y otra por cuenta destino
+        _large_tx_lookup("account_origen", amount_threshold, "_txs_origen"),
+        _large_tx_lookup("account_destino", amount_threshold, "_txs_destino"),
+        # $setUnion evita contar dos veces las transferencias a la misma cuenta
+        {"$addFields": {
+            "transacciones_sospechosas": {"$setUnion": ["$_txs_origen", "$_txs_destino"]}
+        }},
         # Filtrar
         {"$match": {"transacciones_sospechosas.0": {"$exists": True}}},
         {"$project": {
@@ -237,33 +280,115 @@ def get_high_risk_new_accounts(db, days_threshold=365, amount_threshold=1000):
     ]
     return list(db.accounts.aggregate(pipeline))
 
+
+def _plan_stages(plan):
+    """Etapas de un plan de explain, de la raíz a las hojas"""
+    stages = []
+    while plan:
+        stages.append(plan["stage"])
+        children = plan.get("inputStages") or [plan.get("inputStage")]
+        plan = children[0]
+    return stages
+
+
+def explain_high_risk_new_accounts(db, amount_threshold=1000, account_id=None):
+    """
+    Plan ganador de cada lado del $lookup de get_high_risk_new_accounts (la
+    consulta que el servidor ejecuta por cuenta). Sirve de chequeo de
+    regresión: si un lado no usa IXSCAN, cada cuenta vuelve a ser un COLLSCAN.
+
+    Devuelve {"origen": {...}, "destino": {...}, "ok": bool}; lanza ValueError
+    si no se indica cuenta y 'accounts' está vacía.
+    """
+    if account_id is None:
+        sample = db.accounts.find_one({}, {"account_id": 1})
+        if not sample:
+            raise ValueError("sin datos para explicar: la colección 'accounts' está vacía")
+        account_id = sample["account_id"]
+
+    report = {}
+    for side in ("account_origen", "account_destino"):
+        # El mismo filtro que arma el $lookup: igualdad de la cuenta + su $match
+        lookup = _large_tx_lookup(side, amount_threshold, "txs")["$lookup"]
+        query = {lookup["foreignField"]: account_id, **lookup["pipeline"][0]["$match"]}
+        explain = db.command(
+            "explain",
+            {"find": lookup["from"], "filter": query},
+            verbosity="queryPlanner",
+        )
+        winning = explain["queryPlanner"]["winningPlan"]
+        # Con el motor SBE (MongoDB 7+) el plan viene anidado en 'queryPlan'
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        report[side.replace("account_", "")] = {
+            "stages": stages,
+            "ixscan": "IXSCAN" in stages and "COLLSCAN" not in stages,
+        }
+    report["ok"] = all(r["ixscan"] for r in report.values())
+    return report
+
 # Req 11: Detección Global de Cambio IP/Dispositivo
-def detect_suspicious_ip_changes(db):
-    pipeline = [
-        {"$group": {
-            "_id": "$digital_fingerprint.ip",
-            "usuarios_afectados": {"$addToSet": "$user_id"},
-            "total_operaciones": {"$sum": 1},
-            "ubicaciones_detectadas": {"$addToSet": "$digital_fingerprint.location_approx"}
-        }},
-        # Filtro: Más de 1 usuario distinto usando la misma IP
-        {"$match": {
-            "$expr": {"$gt": [{"$size": "$usuarios_afectados"}, 1]}
-        }},
-        {"$project": {
-            "ip_sospechosa": "$_id",
-            "_id": 0,
+def detect_suspicious_ip_changes(db, days=None):
+    """
+    IPs usadas por más de un usuario, leídas del rollup 'ip_usage' que
+    mantiene el loader (filtro indexado sobre user_count, sin recorrer
+    transactions_meta). 'days' limita a IPs con actividad en los últimos N días.
+    Si el rollup no existe: python -m Mongo.loader --rebuild-ip-usage
+    """
+    query = {"user_count": {"$gt": 1}}
+    if days:
+        query["last_seen"] = {"$gte": datetime.utcnow() - timedelta(days=days)}
+
+    cursor = db[IP_USAGE_COLLECTION].find(query).sort("tx_count", DESCENDING)
+    return [
+        {
+            "ip_sospechosa": doc["_id"],
             "analisis": {
-                "usuarios_involucrados": "$usuarios_afectados",
-                "volumen_txs": "$total_operaciones",
-                "geolocalizacion": "$ubicaciones_detectadas"
-            }
-        }},
-        {"$sort": {"analisis.volumen_txs": -1}}
+                "usuarios_involucrados": doc["users"],
+                "volumen_txs": doc["tx_count"],
+                "geolocalizacion": doc.get("locations", []),
+                "primera_vez": doc.get("first_seen"),
+                "ultima_vez": doc.get("last_seen"),
+            },
+        }
+        for doc in cursor
     ]
-    return list(db.transactions_meta.aggregate(pipeline))
 
 # Req 12: Score de Riesgo 
+# Palabras clave de software sospechoso (dispositivos) y rango de IP interna
+RISKY_SOFTWARE = ("TOR", "VPN", "BOT")
+RISKY_IP_PREFIX = "10.0.0"
+SCORE_CHUNK_SIZE = 1000
+RISK_LEVELS = ("BAJO 🟢", "ALTO 🟠", "CRITICO 🔴")
+
+
+def _risk_level(score):
+    return RISK_LEVELS[2] if score > 70 else (RISK_LEVELS[1] if score > 40 else RISK_LEVELS[0])
+
+
+def _has_risky_software(devs_list, ips_list):
+    """
+    Equivale a buscar las palabras en str(lista).upper(): str() de una lista
+    concatena repr() de cada elemento separados por comillas, así que ninguna
+    coincidencia puede cruzar de un elemento a otro.
+    """
+    for d in devs_list:
+        text = repr(d).upper()
+        if any(k in text for k in RISKY_SOFTWARE):
+            return True
+    return any(RISKY_IP_PREFIX in repr(ip).upper() for ip in ips_list)
+
+
+def _risk_factors(flagged_count, unique_dev_count, risky_software):
+    reasons = []
+    if flagged_count > 0:
+        reasons.append(f"🚩 +{40 * flagged_count} pts: Tiene {flagged_count} cuenta(s) marcada(s).")
+    if unique_dev_count >= 3:
+        reasons.append(f"📱 +20 pts: Uso excesivo de dispositivos ({unique_dev_count}).")
+    if risky_software:
+        reasons.append("🕵️ +25 pts: ALERTA TÉCNICA - Uso de TOR, VPN o Bots detectado.")
+    return reasons
+
+
 def calculate_risk_score(db, user_id):
     try:
         uid = int(user_id) 
@@ -295,33 +420,123 @@ def calculate_risk_score(db, user_id):
         ips_list = dev_res[0].get("unique_ips", [])
     
     # Score
+    risky_software = _has_risky_software(devs_list, ips_list)
     score = 0
-    reasons = []
-
-    # Cuentas flag
     if flagged_count > 0:
-        pts = 40 * flagged_count
-        score += pts
-        reasons.append(f"🚩 +{pts} pts: Tiene {flagged_count} cuenta(s) marcada(s).")
-
-    # Dispositivos
+        score += 40 * flagged_count
     if unique_dev_count >= 3:
-        pts = 20
-        score += pts
-        reasons.append(f"📱 +{pts} pts: Uso excesivo de dispositivos ({unique_dev_count}).")
-        
-    # Software Sospechoso (Keywords)
-    devs_str = str(devs_list).upper()
-    ips_str = str(ips_list).upper()
-    
-    if "TOR" in devs_str or "VPN" in devs_str or "BOT" in devs_str or "10.0.0" in ips_str: 
-        pts = 25
-        score += pts
-        reasons.append(f"🕵️ +{pts} pts: ALERTA TÉCNICA - Uso de TOR, VPN o Bots detectado.")
+        score += 20
+    if risky_software:
+        score += 25
 
     return {
         "user_id": uid,
         "risk_score": min(score, 100),
-        "risk_level": "CRITICO 🔴" if score > 70 else ("ALTO 🟠" if score > 40 else "BAJO 🟢"),
-        "factors": reasons
-    }
\ No newline at end of file
+        "risk_level": _risk_level(score),
+        "factors": _risk_factors(flagged_count, unique_dev_count, risky_software)
+    }
+
+
+def compute_risk_scores(db, user_ids=None):
+    """
+    Risk score en lote con las mismas reglas que calculate_risk_score:
+      1) una agregación de cuentas flageadas por usuario,
+      2) una agregación de dispositivos/IPs únicos por usuario,
+    y el score se calcula vectorizado (NumPy).
+    'user_ids' limita el cálculo a esos usuarios (None = todos).
+    Devuelve [{user_id, risk_score, risk_level, factors}].
+    """
+    acc_match = {"flagged": True}
+    user_stages = []
+    if user_ids is not None:
+        ids = list(user_ids)
+        acc_match["user_id"] = {"$in": ids}
+        user_stages.append({"$match": {"user_id": {"$in": ids}}})
+
+    flagged = {
+        row["_id"]: row["n"]
+        for row in db.accounts.aggregate([
+            {"$match": acc_match},
+            {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+        ], allowDiskUse=True)
+    }
+
+    # preserveNullAndEmptyArrays: los usuarios sin logins también se califican
+    devices = list(db.users.aggregate(user_stages + [
+        {"$project": {"user_id": 1, "logins.device": 1, "logins.ip": 1}},
+        {"$unwind": {"path": "$logins", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": "$user_id",
+            "unique_devices": {"$addToSet": "$logins.device"},
+            "unique_ips": {"$addToSet": "$logins.ip"}
+        }}
+    ], allowDiskUse=True))
+
+    devices = [row for row in devices if row["_id"] is not None]
+    uids = [row["_id"] for row in devices]
+    flagged_count = np.fromiter((flagged.get(uid, 0) for uid in uids), dtype=np.int64, count=len(uids))
+    dev_count = np.fromiter((len(row["unique_devices"]) for row in devices), dtype=np.int64, count=len(uids))
+    risky = np.fromiter(
+        (_has_risky_software(row["unique_devices"], row["unique_ips"]) for row in devices),
+        dtype=bool, count=len(uids),
+    )
+
+    raw_score = 40 * flagged_count + 20 * (dev_count >= 3) + 25 * risky
+    score = np.minimum(raw_score, 100)
+    level = np.select([raw_score > 70, raw_score > 40], [2, 1], 0)
+
+    return [
+        {
+            "user_id": uid,
+            "risk_score": int(score[i]),
+            "risk_level": RISK_LEVELS[level[i]],
+            "factors": _risk_factors(int(flagged_count[i]), int(dev_count[i]), bool(risky[i])),
+        }
+        for i, uid in enumerate(uids)
+    ]
+
+
+def score_all_users(db, chunk_size=SCORE_CHUNK_SIZE):
+    """
+    Calcula el risk score de todos los usuarios (compute_risk_scores) y lo
+    escribe en 'risk_scores' (la misma colección que mantiene
+    Mongo/risk_worker.py y que lee get_risk_score) con bulk_write
+    desordenado. Devuelve estadísticas.
+    """
+    start = time.perf_counter()
+    scores = compute_risk_scores(db)
+
+    now = datetime.now()
+    ops = [ReplaceOne({"user_id": row["user_id"]}, dict(row, updated_at=now), upsert=True) for row in scores]
+    written = 0
+    for i in range(0, len(ops), chunk_size):
+        result = db.risk_scores.bulk_write(ops[i:i + chunk_size], ordered=False)
+        written += result.modified_count + result.upserted_count
+    # Campos que versiones anteriores dejaban en 'users'
+    db.users.update_many(
+        {"risk_score": {"$exists": True}},
+        {"$unset": {"risk_score": "", "risk_level": "", "risk_factors": "", "risk_scored_at": ""}},
+    )
+    invalidate_store("risk_scores")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "users": len(scores),
+        "written": written,
+        "elapsed": elapsed,
+        "users_per_sec": len(scores) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def get_stored_risk_score(db, user_id):
+    """Lectura puntual del score materializado por Mongo/risk_worker.py (índice único en user_id)"""
+    try:
+        uid = int(user_id)
+    except ValueError:
+        return None
+    return db.risk_scores.find_one({"user_id": uid}, {"_id": 0})
+
+
+def get_risk_score(db, user_id):
+    """Score materializado si el worker ya lo calculó; si no, se calcula en vivo"""
+    return get_stored_risk_score(db, user_id) or calculate_risk_score(db, user_id)
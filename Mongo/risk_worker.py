@@ -0,0 +1,197 @@
+import time
+from datetime import datetime
+
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from cache import invalidate_store
+
+from .loader import INDEXES
+from .queries import compute_risk_scores
+
+# Worker que mantiene la colección materializada 'risk_scores' escuchando
+# change streams de 'accounts' (cambios de flag) y 'users' (nuevos logins).
+# Solo recalcula los user_id afectados; el resume token se guarda después
+# de cada escritura, así que al reiniciar continúa donde se quedó.
+#
+# Requiere replica set (basta un mongod local con --replSet rs0).
+
+SCORES_COLLECTION = "risk_scores"
+STATE_COLLECTION = "worker_state"
+WORKER_ID = "risk_scores"
+
+WATCHED = ("accounts", "users")
+BATCH_SIZE = 500            # user_id pendientes antes de forzar un recálculo
+FLUSH_INTERVAL = 1.0        # segundos máximos que un cambio espera a reflejarse
+CHECKPOINT_INTERVAL = 30.0  # sin recálculos, cada cuánto se guarda el resume token
+MAX_AWAIT_MS = 500
+
+
+def _is_relevant(change):
+    """Filtra en cliente los updates que no afectan al score"""
+    op = change["operationType"]
+    if op != "update":
+        return True
+    fields = change.get("updateDescription", {}).get("updatedFields", {})
+    removed = change.get("updateDescription", {}).get("removedFields", [])
+    keys = list(fields) + list(removed)
+    if change["ns"]["coll"] == "accounts":
+        return any(k in ("flagged", "user_id") for k in keys)
+    # users: $push a logins llega como 'logins' o 'logins.N'
+    return any(k == "user_id" or k == "logins" or k.startswith("logins.") for k in keys)
+
+
+def _affected_users(change):
+    """Dueño actual y, si hay pre-imagen, el anterior (p. ej. cuenta reasignada o borrada)"""
+    docs = (change.get("fullDocument"), change.get("fullDocumentBeforeChange"))
+    return {doc["user_id"] for doc in docs if doc and doc.get("user_id") is not None}
+
+
+def load_resume_token(db):
+    state = db[STATE_COLLECTION].find_one({"_id": WORKER_ID})
+    return state.get("resume_token") if state else None
+
+
+def save_resume_token(db, token):
+    db[STATE_COLLECTION].update_one(
+        {"_id": WORKER_ID},
+        {"$set": {"resume_token": token, "updated_at": datetime.now()}},
+        upsert=True,
+    )
+
+
+def enable_pre_images(db):
+    """
+    Activa pre-imágenes (MongoDB 6+) para conocer el user_id de documentos
+    borrados; sin ellas los deletes se ignoran.
+    """
+    for name in WATCHED:
+        try:
+            db.command("collMod", name, changeStreamPreAndPostImages={"enabled": True})
+        except OperationFailure as e:
+            print(f"⚠ Pre-imágenes no disponibles en '{name}': {e}")
+
+
+def refresh_scores(db, user_ids):
+    """Recalcula y guarda el score de 'user_ids'; borra los que ya no existen"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    scores = compute_risk_scores(db, user_ids)
+    now = datetime.now()
+    ops = [
+        ReplaceOne({"user_id": row["user_id"]}, dict(row, updated_at=now), upsert=True)
+        for row in scores
+    ]
+    if ops:
+        db[SCORES_COLLECTION].bulk_write(ops, ordered=False)
+
+    gone = user_ids - {row["user_id"] for row in scores}
+    if gone:
+        db[SCORES_COLLECTION].delete_many({"user_id": {"$in": list(gone)}})
+    invalidate_store(SCORES_COLLECTION)
+    return len(user_ids)
+
+
+def backfill(db, chunk_size=BATCH_SIZE):
+    """Carga inicial de risk_scores con todos los usuarios"""
+    start = time.perf_counter()
+    scores = compute_risk_scores(db)
+    now = datetime.now()
+    ops = [ReplaceOne({"user_id": row["user_id"]}, dict(row, updated_at=now), upsert=True) for row in scores]
+    for i in range(0, len(ops), chunk_size):
+        db[SCORES_COLLECTION].bulk_write(ops[i:i + chunk_size], ordered=False)
+    invalidate_store(SCORES_COLLECTION)
+    print(f"✔ Backfill: {len(scores)} scores en {time.perf_counter() - start:.2f}s")
+
+
+def run_worker(db, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, pre_images=False, max_events=None,
+               checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Escucha los cambios y mantiene risk_scores al día.
+    Sin checkpoint previo hace un backfill completo; el stream se abre antes
+    del backfill para no perder cambios ocurridos durante la carga.
+    'pre_images' pide la pre-imagen de los deletes (ver enable_pre_images).
+    'max_events' detiene el worker tras procesar ese número de cambios (pruebas).
+    El resume token se guarda después de cada recálculo y, si solo llegan
+    cambios irrelevantes, cada 'checkpoint_interval' segundos.
+    """
+    db[SCORES_COLLECTION].create_indexes(INDEXES[SCORES_COLLECTION])
+
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": list(WATCHED)},
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+    }}]
+    token = load_resume_token(db)
+    options = {"full_document": "updateLookup", "resume_after": token, "max_await_time_ms": MAX_AWAIT_MS}
+    if pre_images:
+        options["full_document_before_change"] = "whenAvailable"
+
+    with db.watch(pipeline, **options) as stream:
+        if token is None:
+            print("ℹ Sin checkpoint: calculando todos los scores...")
+            backfill(db)
+            token = stream.resume_token
+            save_resume_token(db, token)
+        else:
+            print("▶ Reanudando desde el último checkpoint.")
+
+        pending = set()
+        processed = 0
+        last_flush = last_checkpoint = time.monotonic()
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                processed += 1
+                if _is_relevant(change):
+                    pending |= _affected_users(change)
+
+            flushed = False
+            due = time.monotonic() - last_flush >= flush_interval
+            if len(pending) >= batch_size or (pending and due):
+                print(f"   ↻ {refresh_scores(db, pending)} scores actualizados")
+                pending.clear()
+                last_flush = time.monotonic()
+                flushed = True
+
+            stopping = max_events is not None and processed >= max_events and not pending
+            # El token se guarda solo cuando no queda nada pendiente de escribir:
+            # tras un recálculo, por tiempo o al detenerse
+            checkpoint_due = time.monotonic() - last_checkpoint >= checkpoint_interval
+            if not pending and stream.resume_token != token and (flushed or checkpoint_due or stopping):
+                token = stream.resume_token
+                save_resume_token(db, token)
+                last_checkpoint = time.monotonic()
+
+            if stopping:
+                break
+
+
+if __name__ == "__main__":
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Worker de risk scores sobre change streams (ITESO BANK)")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/?replicaSet=rs0")
+    parser.add_argument("--db", default="fraude_financiero")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL)
+    parser.add_argument("--enable-pre-images", action="store_true", help="Activar pre-imágenes para procesar deletes")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    try:
+        if args.enable_pre_images:
+            enable_pre_images(client[args.db])
+        run_worker(
+            client[args.db],
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+            pre_images=args.enable_pre_images,
+        )
+    except KeyboardInterrupt:
+        print("\n⏹ Worker detenido.")
+    except PyMongoError as e:
+        print(f"✖ Error en el change stream: {e}")
+    finally:
+        client.close()
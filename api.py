@@ -0,0 +1,338 @@
+# api.py
+# Servicio HTTP (ASGI) con las consultas antifraude de Cassandra, MongoDB y Dgraph.
+#
+#   uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+#
+# Cada worker abre UNA Session de Cassandra, UN MongoClient (pool interno) y
+# UN cliente Dgraph sobre DGRAPH_POOL_SIZE stubs; todas las peticiones del
+# worker los comparten. Las consultas usan los drivers síncronos, así que se
+# ejecutan en un pool de hilos acotado para no bloquear el event loop.
+import asyncio
+import datetime
+import decimal
+import functools
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields, is_dataclass
+
+import falcon
+import falcon.asgi
+from falcon import media
+from cassandra.cluster import Cluster
+from pymongo import MongoClient
+
+import cache
+import connect as cn
+from Cassandra import model as cas
+from Dgraph import layering as dg_layering
+from Dgraph import querys as dg_qry
+from Mongo import queries as mongo_queries
+from dossier import build_dossier
+
+logger = logging.getLogger("itesobank.api")
+
+# Hilos para ejecutar consultas bloqueantes por worker de uvicorn
+API_THREADS = int(os.getenv("API_THREADS", "32"))
+# Hilos compartidos por las fuentes de todos los expedientes en curso. Es un
+# pool aparte: build_dossier corre en el de API_THREADS y espera a sus fuentes,
+# así que compartir el mismo pool podría dejarlo sin hilos libres.
+DOSSIER_THREADS = int(os.getenv("DOSSIER_THREADS", "32"))
+# Tope para los parámetros ?limit= y ?first=
+MAX_LIMIT = 1000
+# Tope de ?window_hours= en /grafo/layering (una semana)
+MAX_WINDOW_HOURS = 7 * 24
+
+
+def _json_default(value):
+    """Tipos de los drivers que json no sabe serializar"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if hasattr(value, "_asdict"):          # Row de Cassandra (namedtuple)
+        return value._asdict()
+    if is_dataclass(value):
+        return dataclass_to_dict(value)
+    return str(value)                     # ObjectId y similares
+
+
+def dataclass_to_dict(value):
+    """
+    Como dataclasses.asdict, pero incluye también las propiedades calculadas
+    (p. ej. GhostAccount.total) para que el API devuelva lo mismo que el CLI.
+    """
+    data = {f.name: to_json(getattr(value, f.name)) for f in fields(value)}
+    for name, attr in vars(type(value)).items():
+        if isinstance(attr, property):
+            data[name] = to_json(getattr(value, name))
+    return data
+
+
+def to_json(result):
+    """Materializa ResultSet/cursores en listas; filas namedtuple -> dict"""
+    if result is None or isinstance(result, (dict, str, int, float, bool)):
+        return result
+    if hasattr(result, "_asdict"):
+        return result._asdict()
+    if is_dataclass(result):               # resultados tipados de Dgraph
+        return dataclass_to_dict(result)
+    if hasattr(result, "__iter__"):        # ResultSet, cursores, listas
+        return [to_json(item) for item in result]
+    return result                         # fechas, Decimal, etc.: los resuelve _json_default
+
+
+class Resources:
+    """Conexiones compartidas por todas las peticiones de un worker"""
+
+    def __init__(self):
+        self.cluster = None
+        self.session = None
+        self.mongo_client = None
+        self.mongo_db = None
+        self.dgraph = None
+        self.dgraph_stubs = []
+        self.executor = None
+        self.dossier_executor = None
+
+    async def process_startup(self, scope, event):
+        self.executor = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="api")
+        self.dossier_executor = ThreadPoolExecutor(max_workers=DOSSIER_THREADS, thread_name_prefix="dossier")
+
+        ips = [ip.strip() for ip in cn.CLUSTER_IPS.split(",") if ip.strip()]
+        self.cluster = Cluster(ips)
+        self.session = self.cluster.connect(cn.KEYSPACE)
+
+        self.mongo_client = MongoClient(cn.MONGO_URI, maxPoolSize=cn.MONGO_MAX_POOL_SIZE)
+        self.mongo_db = self.mongo_client[cn.MONGO_DB_NAME]
+
+        self.dgraph, self.dgraph_stubs = cn.create_client_pool()
+        logger.info("Conexiones listas (Cassandra, MongoDB, Dgraph x%d)", len(self.dgraph_stubs))
+
+    async def process_shutdown(self, scope, event):
+        for stub in self.dgraph_stubs:
+            cn.close_client_stub(stub)
+        if self.mongo_client:
+            self.mongo_client.close()
+        if self.cluster:
+            self.cluster.shutdown()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        if self.dossier_executor:
+            self.dossier_executor.shutdown(wait=False)
+
+    async def run(self, func, *args, **kwargs):
+        """Ejecuta una consulta síncrona en el pool y serializa su resultado"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: to_json(func(*args, **kwargs)))
+
+
+def _limit(req, default):
+    return min(req.get_param_as_int("limit", min_value=1, default=default), MAX_LIMIT)
+
+
+def _param(req, name, spec, required=False):
+    """
+    Lee un query param según (getter, default[, (mínimo, máximo)]). Un valor
+    menor al mínimo es un 400; uno mayor al máximo se recorta, como _limit.
+    """
+    getter, default, *bounds = spec
+    kwargs = {"required": required, "default": default}
+    maximum = None
+    if bounds:
+        kwargs["min_value"], maximum = bounds[0]
+    value = getattr(req, getter)(name, **kwargs)
+    if value is not None and maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
+def _respond(resp, result, not_found="Sin resultados"):
+    if result is None:
+        raise falcon.HTTPNotFound(description=not_found)
+    resp.media = result
+
+
+# ---------------------------------------------------------------------
+# Recursos por cliente
+# ---------------------------------------------------------------------
+class ClientResource:
+    """GET /clientes/{user_id}/{vista}"""
+
+    def __init__(self, res):
+        self.res = res
+        session = lambda: res.session
+        mongo = lambda: res.mongo_db
+        # vista -> (función, fuente, límite por defecto o None)
+        self.views = {
+            "perfil": (mongo_queries.get_user_financial_view, mongo, None),
+            "dispositivos": (mongo_queries.get_user_devices, mongo, None),
+            "riesgo": (mongo_queries.get_risk_score, mongo, None),
+            "historial": (cas.q_historial_transaccional, session, 100),
+            "top-operaciones": (cas.q_top_operaciones_por_usuario, session, 20),
+            "cuentas": (cas.q_cuentas_por_usuario, session, None),
+            "transferencias": (cas.q_transferencias_por_usuario, session, None),
+            "fuera-de-rango": (cas.q_transacciones_fuera_de_rango_usuario, session, 50),
+            "rechazados": (cas.q_intentos_rechazados_usuario, session, None),
+            "recibidas": (cas.q_transacciones_recibidas_usuario, session, 50),
+            "duplicados": (cas.q_duplicados_usuario, session, None),
+            "cambios-estado": (cas.q_cambios_estado_por_usuario, session, None),
+            "grafo-riesgo": (dg_qry.fetch_risk_context, lambda: res.dgraph, None),
+        }
+
+    async def on_get(self, req, resp, user_id, vista):
+        if vista not in self.views:
+            raise falcon.HTTPNotFound(description=f"Vista desconocida: {vista}")
+        func, source, default_limit = self.views[vista]
+        args = [source(), user_id]
+        if default_limit is not None:
+            args.append(_limit(req, default_limit))
+        _respond(resp, await self.res.run(func, *args), "Usuario no encontrado")
+
+
+class DossierResource:
+    """GET /clientes/{user_id}: expediente completo (todas las fuentes en paralelo)"""
+
+    def __init__(self, res):
+        self.res = res
+
+    async def on_get(self, req, resp, user_id):
+        dossier = await self.res.run(
+            build_dossier, self.res.session, self.res.dgraph, self.res.mongo_db, user_id,
+            executor=self.res.dossier_executor,
+        )
+        dossier["data"] = {name: to_json(value) for name, value in dossier["data"].items()}
+        resp.media = dossier
+
+
+class ClientSearchResource:
+    """GET /clientes?nombre=Lucia"""
+
+    def __init__(self, res):
+        self.res = res
+
+    async def on_get(self, req, resp):
+        nombre = req.get_param("nombre", required=True)
+        resp.media = await self.res.run(mongo_queries.find_users_by_name, self.res.mongo_db, nombre)
+
+
+# ---------------------------------------------------------------------
+# Monitor global y reportes
+# ---------------------------------------------------------------------
+class GlobalResource:
+    """GET sobre una consulta global; 'params' son los query params opcionales"""
+
+    def __init__(self, res, func, source, default_limit=None, params=None):
+        self.res = res
+        self.func = func
+        self.source = source
+        self.default_limit = default_limit
+        self.params = params or {}
+
+    async def on_get(self, req, resp):
+        kwargs = {}
+        if self.default_limit is not None:
+            kwargs["limit"] = _limit(req, self.default_limit)
+        for name, spec in self.params.items():
+            kwargs[name] = _param(req, name, spec)
+        _respond(resp, await self.res.run(self.func, self.source(), **kwargs))
+
+
+class GraphResource:
+    """GET /grafo/...: detecciones de Dgraph; los segmentos de la ruta van como argumentos"""
+
+    def __init__(self, res, func, params=None):
+        self.res = res
+        self.func = func
+        self.params = params or {}
+
+    async def on_get(self, req, resp, **path):
+        kwargs = dict(path)
+        for name, spec in self.params.items():
+            kwargs[name] = _param(req, name, spec, required=spec[1] is None)
+        _respond(resp, await self.res.run(self.func, self.res.dgraph, **kwargs))
+
+
+class HealthResource:
+    async def on_get(self, req, resp):
+        resp.media = {"status": "ok"}
+
+
+def create_app():
+    # Antes de registrar rutas, para que las vistas tomen las funciones con caché
+    cache.install()
+    res = Resources()
+    app = falcon.asgi.App(middleware=[res])
+
+    json_handler = media.JSONHandler(dumps=functools.partial(json.dumps, default=_json_default))
+    app.req_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+
+    session = lambda: res.session
+    mongo = lambda: res.mongo_db
+
+    app.add_route("/health", HealthResource())
+    app.add_route("/clientes", ClientSearchResource(res))
+    app.add_route("/clientes/{user_id:int}", DossierResource(res))
+    app.add_route("/clientes/{user_id:int}/{vista}", ClientResource(res))
+
+    # Monitor de amenazas
+    app.add_route("/monitor/fuera-de-rango",
+                  GlobalResource(res, cas.q_transacciones_fuera_de_rango_global, session, 100))
+    app.add_route("/monitor/rechazados",
+                  GlobalResource(res, cas.q_intentos_rechazados_global, session, 100))
+    app.add_route("/monitor/ips-sospechosas",
+                  GlobalResource(res, mongo_queries.detect_suspicious_ip_changes, mongo,
+                                 params={"days": ("get_param_as_int", None)}))
+    app.add_route("/monitor/cuentas-flageadas",
+                  GlobalResource(res, mongo_queries.get_flagged_accounts, mongo))
+    app.add_route("/monitor/cuentas-erraticas",
+                  GlobalResource(res, mongo_queries.get_erratic_accounts, mongo,
+                                 params={"min_changes": ("get_param_as_int", 1)}))
+
+    # Analítica forense
+    app.add_route("/reportes/top-cuentas",
+                  GlobalResource(res, cas.q_top_cuentas_global, session, 20))
+    app.add_route("/reportes/duplicados",
+                  GlobalResource(res, cas.q_duplicados_global, session, 100))
+    app.add_route("/reportes/cuentas-nuevas",
+                  GlobalResource(res, mongo_queries.get_high_risk_new_accounts, mongo,
+                                 params={"days_threshold": ("get_param_as_int", 365),
+                                         "amount_threshold": ("get_param_as_float", 1000)}))
+
+    # Detección de patrones en el grafo
+    app.add_route("/grafo/anillos/{device_id}", GraphResource(res, dg_qry.fetch_fraud_ring))
+    app.add_route("/grafo/lavado",
+                  GraphResource(res, dg_qry.fetch_money_laundering_pattern,
+                                params={"min_amount": ("get_param_as_float", 5000),
+                                        "since": ("get_param", ""),
+                                        "until": ("get_param", ""),
+                                        "first": ("get_param_as_int", dg_qry.LAUNDERING_PAGE_SIZE, (1, MAX_LIMIT)),
+                                        "offset": ("get_param_as_int", 0, (0, None))}))
+    app.add_route("/grafo/fantasmas",
+                  GraphResource(res, dg_qry.fetch_ghost_accounts,
+                                params={"max_balance": ("get_param_as_float", 100),
+                                        "min_txs": ("get_param_as_int", 2),
+                                        "first": ("get_param_as_int", dg_qry.GHOST_PAGE_SIZE, (1, MAX_LIMIT)),
+                                        "offset": ("get_param_as_int", 0, (0, None))}))
+    app.add_route("/grafo/suplantacion", GraphResource(res, dg_qry.fetch_identity_theft))
+    app.add_route("/grafo/rutas/{start_account_id}", GraphResource(res, dg_qry.fetch_suspicious_path))
+    app.add_route("/grafo/geo",
+                  GraphResource(res, dg_qry.fetch_geo_heatmap,
+                                params={"lat": ("get_param_as_float", None),
+                                        "lon": ("get_param_as_float", None),
+                                        "radius_km": ("get_param_as_float", 10)}))
+    app.add_route("/grafo/layering/{account_id}",
+                  GraphResource(res, dg_layering.fetch_layering,
+                                params={"max_hops": ("get_param_as_int", dg_layering.MAX_HOPS,
+                                                     (2, dg_layering.MAX_HOPS)),
+                                        "window_hours": ("get_param_as_float", dg_layering.WINDOW_HOURS,
+                                                         (1, MAX_WINDOW_HOURS))}))
+    return app
+
+
+app = create_app()
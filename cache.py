@@ -0,0 +1,223 @@
+# cache.py
+# Caché read-through para las consultas por usuario de Cassandra, MongoDB y Dgraph.
+#
+# La llave es (familia, generación, consulta, argumentos) sin la conexión
+# (session/db/client). Cada familia tiene su TTL; el backend en memoria es
+# un LRU acotado por bytes. invalidate(familia) sube la generación, así las
+# entradas viejas dejan de ser alcanzables sin recorrer el backend (sirve
+# igual para un backend remoto). Los loaders lo llaman después de escribir.
+# El backend en memoria es por proceso: para que las escrituras de otro
+# proceso (loader, risk_worker) lleguen al API hace falta un backend compartido.
+# Los resultados se copian al guardar y al leer: mutar uno no toca el caché.
+import copy
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+
+import connect as cn
+
+# Familia -> TTL en segundos
+TTLS = {
+    "mongo": cn.CACHE_TTL_MONGO,
+    "cassandra": cn.CACHE_TTL_CASSANDRA,
+    "dgraph": cn.CACHE_TTL_DGRAPH,
+    "riesgo": cn.CACHE_TTL_RIESGO,
+    "ips": cn.CACHE_TTL_IPS,
+}
+
+# (módulo, función, familia) que install() envuelve con el caché
+CACHED_QUERIES = [
+    ("Mongo.queries", "get_user_financial_view", "mongo"),
+    ("Mongo.queries", "get_user_devices", "mongo"),
+    ("Mongo.queries", "find_users_by_name", "mongo"),
+    ("Mongo.queries", "get_risk_score", "riesgo"),
+    ("Mongo.queries", "detect_suspicious_ip_changes", "ips"),
+    ("Cassandra.model", "q_historial_transaccional", "cassandra"),
+    ("Cassandra.model", "q_top_operaciones_por_usuario", "cassandra"),
+    ("Cassandra.model", "q_cuentas_por_usuario", "cassandra"),
+    ("Cassandra.model", "q_transferencias_por_usuario", "cassandra"),
+    ("Cassandra.model", "q_transacciones_recibidas_usuario", "cassandra"),
+    ("Cassandra.model", "q_cambios_estado_por_usuario", "cassandra"),
+    ("Dgraph.querys", "fetch_risk_context", "dgraph"),
+]
+
+# Tiendas -> familias que dependen de ellas (para los hooks de los loaders)
+STORE_FAMILIES = {
+    "mongo": ("mongo", "riesgo", "ips"),
+    "risk_scores": ("riesgo",),         # Mongo/risk_worker.py
+    "ip_usage": ("ips",),               # Mongo/loader.update_ip_usage
+    "cassandra": ("cassandra",),
+    "dgraph": ("dgraph",),
+}
+
+
+def _sizeof(obj, depth=0):
+    """Tamaño aproximado en bytes (recorre contenedores y dataclasses, sin ciclos profundos)"""
+    size = sys.getsizeof(obj)
+    if depth > 6:
+        return size
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k, depth + 1) + _sizeof(v, depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(v, depth + 1) for v in obj)
+    elif is_dataclass(obj):
+        size += sum(_sizeof(getattr(obj, f.name), depth + 1) for f in fields(obj))
+    return size
+
+
+class MemoryBackend:
+    """
+    LRU en proceso acotado por bytes. Cualquier backend con la misma interfaz
+    (get, set, delete, clear, stats) puede reemplazarlo, p. ej. uno sobre Redis.
+    """
+
+    def __init__(self, max_bytes=cn.CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._data = OrderedDict()      # key -> (expira_en, valor, bytes)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Devuelve (encontrado, valor)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return False, None
+            self._data.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value, ttl):
+        size = _sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            # Demasiado grande: no se guarda, pero tampoco queda la versión anterior
+            if size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic() + ttl, value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {"entries": len(self._data), "bytes": self.bytes,
+                "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+    def _remove(self, key):
+        self.bytes -= self._data.pop(key)[2]
+
+
+class QueryCache:
+    def __init__(self, backend=None, ttls=None):
+        self.backend = backend or MemoryBackend()
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        # Contadores y generaciones se actualizan desde los hilos del API
+        self._lock = threading.Lock()
+
+    def _key(self, family, name, args, kwargs):
+        with self._lock:
+            generation = self.generations.get(family, 0)
+        return (family, generation, name, args, tuple(sorted(kwargs.items())))
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def call(self, family, func, handle, *args, **kwargs):
+        """
+        Ejecuta func(handle, *args) pasando por el caché. 'handle' (session,
+        db o client) no forma parte de la llave. Los ResultSet de Cassandra
+        se materializan en listas para poder reutilizarlos. Cada lector
+        recibe su propia copia del valor guardado.
+        """
+        key = self._key(family, func.__qualname__, args, kwargs)
+        found, value = self.backend.get(key)
+        self._count(found)
+        if found:
+            return copy.deepcopy(value)
+
+        value = func(handle, *args, **kwargs)
+        if value is not None and not isinstance(value, (dict, list, str)) and not is_dataclass(value):
+            value = list(value)
+        if value is not None:
+            self.backend.set(key, copy.deepcopy(value), self.ttls.get(family, 60))
+        return value
+
+    def wrap(self, family, func):
+        @functools.wraps(func)
+        def cached(handle, *args, **kwargs):
+            return self.call(family, func, handle, *args, **kwargs)
+        cached.uncached = func
+        return cached
+
+    def invalidate(self, family=None):
+        """Invalida una familia (o todo si family es None)"""
+        with self._lock:
+            if family is None:
+                self.backend.clear()
+                self.generations.clear()
+            else:
+                self.generations[family] = self.generations.get(family, 0) + 1
+
+    def invalidate_store(self, store):
+        """Hook para loaders: invalida las familias que dependen de 'store'"""
+        for family in STORE_FAMILIES.get(store, ()):
+            self.invalidate(family)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return dict(
+            self.backend.stats(),
+            hits=hits,
+            misses=misses,
+            hit_rate=hits / total if total else 0.0,
+        )
+
+
+CACHE = QueryCache()
+
+
+def install(cache=CACHE):
+    """
+    Reemplaza las funciones de CACHED_QUERIES en sus módulos por la versión
+    con caché; los presentadores (show_*, query_*) las buscan en el módulo
+    al llamarse, así que también leen del caché. Es idempotente.
+    """
+    import importlib
+
+    for module_name, func_name, family in CACHED_QUERIES:
+        module = importlib.import_module(module_name)
+        func = getattr(module, func_name)
+        if not hasattr(func, "uncached"):
+            setattr(module, func_name, cache.wrap(family, func))
+    return cache
+
+
+def invalidate_store(store):
+    CACHE.invalidate_store(store)
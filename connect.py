@@ -7,13 +7,31 @@ import pydgraph
 CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', '127.0.0.1')
 KEYSPACE = os.getenv('CASSANDRA_KEYSPACE', 'itesobank_antifraude')
 REPLICATION_FACTOR = os.getenv('CASSANDRA_REPLICATION_FACTOR', '1')
+LOAD_WORKERS = os.getenv('CASSANDRA_LOAD_WORKERS', '4')
+# Derivar las tablas de transacciones de data/Cassandra/transactions.csv (opt-in):
+# las reglas de ruteo no reproducen los CSV curados fila por fila
+TX_FANOUT = os.getenv('CASSANDRA_TX_FANOUT', 'false').lower() == 'true'
 
 #MongoDB
 client = MongoClient('mongodb://localhost:27017/')
 db = client.ItesoBank
 
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'fraude_financiero')
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+
 # Dgraph
 DGRAPH_URI = os.getenv("DGRAPH_URI", "localhost:9080")
+# Número de stubs gRPC que comparte el cliente (balanceo round-robin)
+DGRAPH_POOL_SIZE = int(os.getenv("DGRAPH_POOL_SIZE", "4"))
+
+# Caché de consultas (cache.py): memoria máxima y TTL en segundos por familia
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_MONGO = float(os.getenv("CACHE_TTL_MONGO", "60"))
+CACHE_TTL_CASSANDRA = float(os.getenv("CACHE_TTL_CASSANDRA", "30"))
+CACHE_TTL_DGRAPH = float(os.getenv("CACHE_TTL_DGRAPH", "120"))
+CACHE_TTL_RIESGO = float(os.getenv("CACHE_TTL_RIESGO", "30"))
+CACHE_TTL_IPS = float(os.getenv("CACHE_TTL_IPS", "60"))
 
 def create_client_stub():
     return pydgraph.DgraphClientStub(DGRAPH_URI)
@@ -24,3 +42,7 @@ def create_client(client_stub):
 def close_client_stub(client_stub):
     client_stub.close()
 
+def create_client_pool(size=DGRAPH_POOL_SIZE):
+    """Cliente Dgraph sobre varios stubs; devuelve (client, stubs)"""
+    stubs = [create_client_stub() for _ in range(max(1, size))]
+    return pydgraph.DgraphClient(*stubs), stubs
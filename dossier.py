@@ -0,0 +1,125 @@
+# dossier.py
+# Expediente completo de un cliente: consulta Cassandra, MongoDB y Dgraph en paralelo.
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import is_dataclass
+
+from Cassandra import model as cas
+from Dgraph import querys as dg_qry
+from Mongo import queries as mongo_queries
+
+# Límites por defecto de las consultas de Cassandra del expediente
+HISTORIAL_LIMIT = 100
+RECIBIDAS_LIMIT = 50
+
+
+def _timed(func, *args, **kwargs):
+    """Ejecuta func y devuelve (resultado, error, segundos)"""
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        # Los ResultSet de Cassandra se consumen dentro del hilo (paginación incluida)
+        if result is not None and not isinstance(result, (dict, list)) and not is_dataclass(result):
+            result = list(result)
+        return result, None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def dossier_sources(session, client, mongo_db, user_id: int):
+    """
+    Fuentes del expediente: {nombre: (función, args)}.
+    Cada entrada es independiente de las demás y puede correr en su propio hilo.
+    """
+    return {
+        "perfil_financiero": (mongo_queries.get_user_financial_view, (mongo_db, user_id)),
+        "dispositivos": (mongo_queries.get_user_devices, (mongo_db, user_id)),
+        "risk_score": (mongo_queries.calculate_risk_score, (mongo_db, user_id)),
+        "historial": (cas.q_historial_transaccional, (session, user_id, HISTORIAL_LIMIT)),
+        "recibidas": (cas.q_transacciones_recibidas_usuario, (session, user_id, RECIBIDAS_LIMIT)),
+        "transferencias": (cas.q_transferencias_por_usuario, (session, user_id)),
+        "cambios_estado": (cas.q_cambios_estado_por_usuario, (session, user_id)),
+        "grafo_riesgo": (dg_qry.fetch_risk_context, (client, user_id)),
+    }
+
+
+def build_dossier(session, client, mongo_db, user_id: int, workers=None, executor=None):
+    """
+    Lanza todas las consultas del expediente al mismo tiempo, de modo que la
+    latencia total sea la de la fuente más lenta y no la suma de todas.
+
+    'executor' es un pool compartido (p. ej. el del API): sin él se crea un
+    pool propio de 'workers' hilos para este expediente.
+
+    Devuelve:
+        {
+          "user_id": ...,
+          "data":    {fuente: resultado},
+          "errors":  {fuente: "mensaje"},     # solo las fuentes que fallaron
+          "timings": {fuente: segundos},
+          "total":   segundos de reloj de todo el expediente
+        }
+    """
+    sources = dossier_sources(session, client, mongo_db, user_id)
+    start = time.perf_counter()
+
+    def run_all(pool):
+        futures = {
+            name: pool.submit(_timed, func, *args)
+            for name, (func, args) in sources.items()
+        }
+        return {name: fut.result() for name, fut in futures.items()}
+
+    if executor is not None:
+        outcomes = run_all(executor)
+    else:
+        with ThreadPoolExecutor(max_workers=workers or len(sources)) as pool:
+            outcomes = run_all(pool)
+
+    dossier = {"user_id": user_id, "data": {}, "errors": {}, "timings": {}}
+    for name, (result, error, elapsed) in outcomes.items():
+        dossier["data"][name] = result
+        dossier["timings"][name] = elapsed
+        if error is not None:
+            dossier["errors"][name] = str(error)
+    dossier["total"] = time.perf_counter() - start
+    return dossier
+
+
+def print_dossier(dossier):
+    """Resumen en consola del expediente y tiempos por fuente"""
+    data = dossier["data"]
+    print(f"\n🗂️  EXPEDIENTE COMPLETO: Usuario {dossier['user_id']}")
+
+    perfil = data.get("perfil_financiero")
+    if perfil:
+        print(f"   👤 {perfil.get('nombre_completo')} | {perfil.get('email')}")
+        resumen = perfil.get("resumen_bancario", {})
+        print(f"   $ Saldo Total Global: ${resumen.get('total_en_banco', 0):,.2f} "
+              f"({resumen.get('num_productos', 0)} productos)")
+
+    risk = data.get("risk_score")
+    if risk:
+        print(f"   ⚠️  Risk Score: {risk['risk_score']}/100 ({risk['risk_level']})")
+
+    disp = data.get("dispositivos")
+    if disp:
+        sec = disp.get("resumen_seguridad", {})
+        print(f"   📱 Dispositivos únicos: {sec.get('total_dispositivos_unicos')}")
+
+    grafo = data.get("grafo_riesgo")
+    if grafo:
+        compartidos = sum(1 for d in grafo.devices if d.used_by_others)
+        print(f"   🕸️  Riesgo en grafo: {grafo.risk_score}/100 | "
+              f"Dispositivos compartidos: {compartidos}")
+
+    for name in ("historial", "recibidas", "transferencias", "cambios_estado"):
+        rows = data.get(name)
+        if rows is not None:
+            print(f"   💸 {name}: {len(rows)} registros")
+
+    print("\n   ⏱️  Tiempos por fuente:")
+    for name, elapsed in sorted(dossier["timings"].items(), key=lambda kv: -kv[1]):
+        estado = f"✖ {dossier['errors'][name]}" if name in dossier["errors"] else "✔"
+        print(f"      - {name:<18} {elapsed * 1000:8.1f} ms  {estado}")
+    print(f"   Total (en paralelo): {dossier['total'] * 1000:.1f} ms")
@@ -1,11 +1,16 @@
 import time
+import datetime
 import pydgraph
 from cassandra.cluster import Cluster
 import connect as cn
 from connect import CLUSTER_IPS, KEYSPACE
 from populate import populate_cassandra, populate_dgraph
 from Cassandra import model as cas
+from Dgraph import layering as dg_layering
 from Dgraph import querys as dg_qry
+from Dgraph.uid_store import UidStore
+from dossier import build_dossier, print_dossier
+import cache
 #Imports mongo
 from pymongo import MongoClient
 from Mongo.loader import populate_database as populateMongo
@@ -97,6 +102,9 @@ def menu_investigacion_cliente(session, client, mongo_client):
         print("\n   8. Calcular Risk Score del sujeto ")
         print("   9. Mapa de conexiones sospechosas ")
 
+        print("\n   --- 🗂️  Consolidado ---")
+        print("\n   10. Expediente completo (todas las fuentes en paralelo) ")
+
         print("\n   0. 🔙 Abortar investigación / Nuevo objetivo")
 
         opcion = input("   >> ").strip()
@@ -141,8 +149,8 @@ def menu_investigacion_cliente(session, client, mongo_client):
             #  calcular Risk Score del sujeto (Mongo #12)"
             print(f"\n⧗ Calculando perfil de riesgo para el usuario {cliente_id}...")
 
-            # Llamada a la función real de queries.py
-            risk = mongo_queries.calculate_risk_score(mongo_db, cliente_id)
+            # Score materializado (risk_scores) o cálculo en vivo
+            risk = mongo_queries.get_risk_score(mongo_db, cliente_id)
 
             if risk:
                 # Determinamos íconos visuales
@@ -168,6 +176,11 @@ def menu_investigacion_cliente(session, client, mongo_client):
             print(f"\n⧗ Consultando grafo de riesgo para: {cliente_id}...")
             dg_qry.query_risk_scoring(client, str(cliente_id))
 
+        elif opcion == "10":
+            # Expediente completo: Mongo + Cassandra + Dgraph al mismo tiempo
+            print(f"\n⧗ Armando expediente de {cliente_id} en paralelo...")
+            print_dossier(build_dossier(session, client, mongo_db, int(cliente_id)))
+
                 
 
         # Queries Cassandra
@@ -220,6 +233,7 @@ def menu_monitor_amenazas(session, client, mongo_client):
         print("   6. Cuentas Fantasma / Synthetic ID    ")
         print("   7. Suplantación de Identidad (Account Takeover)   ")
         print("   8. Rastreo de rutas de dinero ilícito     ")
+        print("   11. Estratificación: ciclos y fan-out/fan-in ")
 
         print("\n   --- 🚩 Watchlists y Anomalías ---")
         print("\n   9. Usuarios en Lista Negra / Flageados ")
@@ -238,7 +252,8 @@ def menu_monitor_amenazas(session, client, mongo_client):
         # MongoDB
         elif opcion == "3":
             # Req 11: Alerta masiva cambios IP
-            alerts = mongo_queries.detect_suspicious_ip_changes(mongo_db)
+            dias = input("Ventana en días (Enter = todo el historial): ").strip()
+            alerts = mongo_queries.detect_suspicious_ip_changes(mongo_db, days=int(dias) if dias.isdigit() else None)
             print(f"\n ⚠ ALERTAS DE RED (IPs Compartidas/Sospechosas):")
             if not alerts:
                 print("   ✔ No se detectaron anomalías de red (Botnets).")
@@ -283,10 +298,15 @@ def menu_monitor_amenazas(session, client, mongo_client):
         elif opcion == "5":
             # Lavado de dinero
             monto_input = input("   Monto mínimo para alertar (default 5000): ").strip() or "5000"
+            desde = input("   Desde fecha (YYYY-MM-DD, opcional): ").strip() or None
             try:
-                dg_qry.query_money_laundering_pattern(client, float(monto_input))
+                monto = float(monto_input)
+                if desde:
+                    desde = datetime.date.fromisoformat(desde).isoformat()
             except ValueError:
-                print("   Error: El monto debe ser un número.")
+                print("   Error: El monto debe ser un número y la fecha tener formato YYYY-MM-DD.")
+            else:
+                dg_qry.query_money_laundering_pattern(client, monto, since=desde)
 
         elif opcion == "6":
             # Cuentas Fantasmas
@@ -308,6 +328,19 @@ def menu_monitor_amenazas(session, client, mongo_client):
             else:
                 print("   ⚠ ID de cuenta requerido.")
 
+        elif opcion == "11":
+            # Layering: ciclos A->...->A y smurfing (fan-out -> fan-in)
+            acc_input = input("   Ingrese ID de Cuenta a analizar (ej: ACCT-3001-A): ").strip()
+            horas = input(f"   Ventana en horas (default {dg_layering.WINDOW_HOURS}): ").strip()
+            if acc_input:
+                try:
+                    ventana = float(horas) if horas else dg_layering.WINDOW_HOURS
+                    dg_layering.query_layering(client, acc_input, window_hours=ventana)
+                except ValueError:
+                    print("   Error: La ventana debe ser un número.")
+            else:
+                print("   ⚠ ID de cuenta requerido.")
+
         elif opcion == "0":
             break
         else:
@@ -424,6 +457,9 @@ def menu_analitica_forense(session, client, mongo_client):
 
 # Menu principal
 def main():
+    # Consultas por usuario con caché read-through (TTL + LRU)
+    cache.install()
+
     # 1. Conexión Dgraph
     try:
         client_stub = cn.create_client_stub()
@@ -488,6 +524,9 @@ def main():
             print("\n[⚙️ MODO ADMINISTRADOR]")
             print("\n1. Poblar Cassandra, Mongo, Dgraph ")
             print("2. DROP ALL DATA ")
+            print("3. Recalcular Risk Score de todos los usuarios (lote) ")
+            print("4. Estadísticas de caché / vaciar caché ")
+            print("5. Verificar planes de consultas (explain) ")
             print("\n0. Salir")
             sub_op = input(">> ").strip()
 
@@ -501,6 +540,7 @@ def main():
                 print("\n🚀 Iniciando población de Mongo...")
                 try:
                     populateMongo(mongo_db,"data/mongo")
+                    cache.invalidate_store("mongo")
                 except Exception as e:
                     print(f"Error en Mongo {e}")
 
@@ -556,16 +596,50 @@ def main():
                         try:
                             op = pydgraph.Operation(drop_all=True)
                             client.alter(op)
+                            # Los UIDs guardados ya no existen en Dgraph
+                            with UidStore() as uid_store:
+                                uid_store.clear()
                             print("🗑️ Dgraph reseteado (Drop All).")
                         except Exception as e:
                             print(f"❌ Error reseteando Dgraph: {e}")
                     else:
                         print("⚠️ No hay cliente Dgraph para ejecutar Drop All.")
 
+                    cache.CACHE.invalidate()
                     print("\n✅ Sistema reseteado correctamente.")
                 else:
                     print("Operación cancelada.")
 
+            elif sub_op == "3":
+                print("\n⧗ Calculando risk score en lote...")
+                try:
+                    stats = mongo_queries.score_all_users(mongo_db)
+                    print(f"✔ {stats['users']} usuarios calificados en {stats['elapsed']:.2f}s "
+                          f"({stats['users_per_sec']:,.0f} usuarios/s, {stats['written']} actualizados)")
+                except Exception as e:
+                    print(f"✖ Error calculando risk score: {e}")
+
+            elif sub_op == "4":
+                st = cache.CACHE.stats()
+                print(f"\n🧠 Caché: {st['entries']} entradas | {st['bytes'] / 1024:,.1f} KB de {st['max_bytes'] / 1024:,.0f} KB")
+                print(f"   Hits: {st['hits']} | Misses: {st['misses']} | Hit rate: {st['hit_rate']:.0%} | Evictions: {st['evictions']}")
+                if input("¿Vaciar caché? (s/n): ").strip().lower() == "s":
+                    cache.CACHE.invalidate()
+                    print("🗑️ Caché vaciado.")
+
+            elif sub_op == "5":
+                try:
+                    plan = mongo_queries.explain_high_risk_new_accounts(mongo_db)
+                    for lado in ("origen", "destino"):
+                        marca = "✔" if plan[lado]["ixscan"] else "✖"
+                        print(f"   {marca} Cuentas nuevas / lookup {lado}: {' -> '.join(plan[lado]['stages'])}")
+                    if not plan["ok"]:
+                        print("⚠ Sin IXSCAN: reconstruye los índices con 'python -m Mongo.loader --indexes-only'")
+                except ValueError as e:
+                    print(f"⚠ {e}")
+                except Exception as e:
+                    print(f"✖ Error obteniendo el plan: {e}")
+
         elif opcion == "0":
             print("Cerrando conexiones...")
             cn.close_client_stub(client_stub)
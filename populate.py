@@ -1,29 +1,62 @@
 # populate.py
+import os
 from cassandra.cluster import Cluster
 import connect
-from Cassandra.loader import create_keyspace_and_tables, load_all_data
+from cache import invalidate_store
+from Cassandra.loader import CANONICAL_TX_FILE, create_keyspace_and_tables, load_all_data
+from Cassandra.model import USE_MONTH_BUCKETS
 from Dgraph import model as mo
+from Dgraph.uid_store import UidStore
 
-def populate_cassandra():
+def populate_cassandra(workers=None, fanout=None):
+    """
+    Crea el esquema y carga los CSV. 'workers' = tablas cargadas en paralelo
+    (por defecto CASSANDRA_LOAD_WORKERS). Con fanout=True (por defecto
+    CASSANDRA_TX_FANOUT) las tablas de transacciones se derivan del CSV
+    canónico en lugar de sus CSV curados.
+    """
     ips = [ip.strip() for ip in connect.CLUSTER_IPS.split(",")]
     cluster = Cluster(ips)
     session = cluster.connect()
 
+    if workers is None:
+        workers = int(connect.LOAD_WORKERS)
+    if fanout is None:
+        fanout = connect.TX_FANOUT
+
     rf = int(connect.REPLICATION_FACTOR)
     create_keyspace_and_tables(session, connect.KEYSPACE, rf)
-    load_all_data(session, connect.KEYSPACE, base_path="data/Cassandra")
 
+    base_path = "data/Cassandra"
+    fanout_path = None
+    if fanout:
+        fanout_path = os.path.join(base_path, CANONICAL_TX_FILE)
+        if not os.path.exists(fanout_path):
+            raise FileNotFoundError(f"Fan-out activado pero no existe {fanout_path}")
+    load_all_data(
+        session,
+        connect.KEYSPACE,
+        base_path=base_path,
+        workers=workers,
+        fanout_path=fanout_path,
+        month_buckets=USE_MONTH_BUCKETS,
+    )
+
+    invalidate_store("cassandra")
     print("✅ Cassandra poblada correctamente.")
     cluster.shutdown()
 
-def populate_dgraph():
+def populate_dgraph(edges_only=False):
     print("🚀 Conectando a Dgraph...")
     client_stub = connect.create_client_stub()
     client = connect.create_client(client_stub)
 
     try:
         mo.create_schema(client)
-        mo.load_data(client)
+        # El mapa xid->uid persistente evita duplicar nodos en recargas
+        with UidStore() as uid_store:
+            mo.load_data(client, uid_store=uid_store, edges_only=edges_only, upsert=True)
+        invalidate_store("dgraph")
     finally:
         client_stub.close()
 
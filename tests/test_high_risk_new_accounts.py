@@ -0,0 +1,92 @@
+# Regresión de get_high_risk_new_accounts: ambos lados del $lookup deben
+# resolverse con IXSCAN sobre los índices compuestos de Mongo/loader.py.
+# Necesita un mongod; sin él las pruebas se omiten.
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+
+from Mongo.loader import INDEXES
+from Mongo.queries import explain_high_risk_new_accounts, get_high_risk_new_accounts
+
+MONGO_URI = os.getenv("MONGO_TEST_URI", os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+
+
+@pytest.fixture(scope="module")
+def db():
+    client = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip(f"mongod no disponible en {MONGO_URI}")
+
+    name = f"test_itesobank_{uuid.uuid4().hex[:8]}"
+    database = client[name]
+    for collection in ("accounts", "transactions_meta"):
+        database[collection].create_indexes(INDEXES[collection])
+
+    now = datetime.utcnow()
+    database.accounts.insert_many([
+        {"account_id": "ACC-1", "fecha_creacion": now - timedelta(days=10), "saldo_actual": 10.0},
+        {"account_id": "ACC-2", "fecha_creacion": now - timedelta(days=10), "saldo_actual": 20.0},
+        {"account_id": "ACC-OLD", "fecha_creacion": now - timedelta(days=900), "saldo_actual": 30.0},
+    ])
+    database.transactions_meta.insert_many([
+        # Grande, saliente de ACC-1
+        {"transaction_id": 1, "flow": {"account_origen": "ACC-1", "account_destino": "X"},
+         "amount_details": {"total": 5000.0}, "timestamp": now},
+        # Grande, entrante a ACC-1
+        {"transaction_id": 2, "flow": {"account_origen": "Y", "account_destino": "ACC-1"},
+         "amount_details": {"total": 7000.0}, "timestamp": now},
+        # Grande, de ACC-2 a sí misma: debe contarse una vez
+        {"transaction_id": 3, "flow": {"account_origen": "ACC-2", "account_destino": "ACC-2"},
+         "amount_details": {"total": 9000.0}, "timestamp": now},
+        # Chica: no cuenta
+        {"transaction_id": 4, "flow": {"account_origen": "ACC-2", "account_destino": "Z"},
+         "amount_details": {"total": 10.0}, "timestamp": now},
+        # Cuenta vieja: no cuenta
+        {"transaction_id": 5, "flow": {"account_origen": "ACC-OLD", "account_destino": "Z"},
+         "amount_details": {"total": 8000.0}, "timestamp": now},
+    ] + [
+        {"transaction_id": 100 + i, "flow": {"account_origen": f"R-{i}", "account_destino": f"R-{i + 1}"},
+         "amount_details": {"total": float(i)}, "timestamp": now}
+        for i in range(200)
+    ])
+
+    yield database
+    client.drop_database(name)
+    client.close()
+
+
+@pytest.mark.parametrize("side", ["origen", "destino"])
+def test_lookup_side_uses_index(db, side):
+    stages = explain_high_risk_new_accounts(db, amount_threshold=1000, account_id="ACC-1")[side]["stages"]
+
+    assert "IXSCAN" in stages
+    assert "COLLSCAN" not in stages
+
+
+def test_explain_report_ok(db):
+    report = explain_high_risk_new_accounts(db, amount_threshold=1000)
+    assert report["ok"], report
+
+
+def test_explain_without_accounts(db):
+    empty = db.client[db.name + "_vacia"]
+    try:
+        with pytest.raises(ValueError):
+            explain_high_risk_new_accounts(empty)
+    finally:
+        db.client.drop_database(empty.name)
+
+
+def test_high_risk_new_accounts_results(db):
+    results = {r["cuenta_riesgo"]: r for r in get_high_risk_new_accounts(db, 365, 1000)}
+
+    assert set(results) == {"ACC-1", "ACC-2"}
+    assert results["ACC-1"]["alerta"]["total_txs_grandes"] == 2
+    assert results["ACC-2"]["alerta"]["total_txs_grandes"] == 1